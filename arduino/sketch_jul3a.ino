@@ -1,139 +1,158 @@
 #include "DHT.h"
 #include <Arduino.h>
 #define DHTTYPE DHT11
-#define DHTPIN 7 
+#define DHTPIN 7
 #define REDPIN 9
 #define GREENPIN 6
 #define BLUEPIN 5
 
+// framed serial protocol, see flaskApp/serialProtocol.py
+//   magic (2) | type (1) | seq (1) | len (1) | payload (len) | crc16 (2)
+#define MAGIC_0 0xA5
+#define MAGIC_1 0x5A
+#define FRAME_COLORS 0x01
+#define FRAME_ACK 0x02
+#define FRAME_TEMP 0x03
+#define FRAME_HELLO 0x04
+#define FRAME_LOG 0x05
+#define MAX_PAYLOAD 64
+#define ACK_OK 0
+#define ACK_BAD_PAYLOAD 1
+
+#define TEMP_INTERVAL 60000UL
+
 
 
 DHT dht(DHTPIN, DHTTYPE);
 
+// one rgb strip per row, zones past the last row drive the last strip
+const byte zonePins[][3] = {{REDPIN, GREENPIN, BLUEPIN}};
+const byte ZONE_COUNT = sizeof(zonePins) / sizeof(zonePins[0]);
 
-float oneHourData[60] = {};
-float twelveHourData[12] = {};
+byte txSeq = 0;
+unsigned long lastTemp = 0;
 
-int counter = 0;
-float temp = 0;
-float oneHourAvg = 0;
+// frame being received: type, seq, len, payload, crc
+byte rxBuf[3 + MAX_PAYLOAD + 2];
+byte rxState = 0;
+byte rxPos = 0;
+byte rxNeed = 0;
 
 // setup
 void setup() {
-  
+
   Serial.begin(9600);
-  Serial.setTimeout(1);
-  Serial.println(F("DHTxx test!"));
   dht.begin();
 
-  for (int i=0; i<12; i++){
-    twelveHourData[i] = -99.99;
-  }
-
-  pinMode(REDPIN, OUTPUT);
-  pinMode(GREENPIN, OUTPUT);
-  pinMode(BLUEPIN, OUTPUT);
-
-  analogWrite(REDPIN, 0);
-  analogWrite(BLUEPIN, 0);
-  analogWrite(GREENPIN, 0);
-
+  for (byte z=0; z<ZONE_COUNT; z++){
+    for (byte c=0; c<3; c++){
+      pinMode(zonePins[z][c], OUTPUT);
+      analogWrite(zonePins[z][c], 0);}}
 
+  // tells the host to resend the colors
+  sendFrame(FRAME_HELLO, NULL, 0);
 }
 
-// updates the temp history
-void updateArray(float* targetArray, float initalVal, int arraySize){
-
-    float holderArray[arraySize] = {};
-    holderArray[0] = initalVal;
-
-    for (int i=0; i<arraySize-1; i++){
-      holderArray[i+1] = targetArray[i];}
+// CRC-16/CCITT, poly 0x1021
+uint16_t crc16(const byte* data, byte len, uint16_t crc){
+  for (byte i=0; i<len; i++){
+    crc ^= (uint16_t)data[i] << 8;
+    for (byte b=0; b<8; b++){
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;}}
+  return crc;
+}
 
-    for (int i=0; i<arraySize; i++){
-      targetArray[i] = holderArray[i];}
+void sendFrame(byte type, const byte* payload, byte len){
+  byte header[3] = {type, txSeq++, len};
+  uint16_t crc = crc16(header, 3, 0xFFFF);
+  crc = crc16(payload, len, crc);
+  Serial.write(MAGIC_0);
+  Serial.write(MAGIC_1);
+  Serial.write(header, 3);
+  if (len > 0){
+    Serial.write(payload, len);}
+  Serial.write((byte)(crc & 0xFF));
+  Serial.write((byte)(crc >> 8));
+}
 
+void sendLog(const char* text){
+  sendFrame(FRAME_LOG, (const byte*)text, strlen(text));
 }
 
-// get temp data (C)
-float getTemp(){
+// get temp data (C), sent as a little-endian float
+void sendTemp(){
   float t = dht.readTemperature();
   if (isnan(t)) {
-    Serial.println(F("Failed to read from DHT sensor!"));
+    sendLog("Failed to read from DHT sensor!");
+    return;
   }
-  return t;
+  byte payload[4];
+  memcpy(payload, &t, 4);
+  sendFrame(FRAME_TEMP, payload, 4);
 }
 
-void updateColor(String input){
-
-  Serial.println(input);
-
-  String number = "";
-  int rgb[3] = {};
-  int count = 0;
-  String digits = "0123456789";
-
-  for (int j=0; j<input.length(); j++){
-
-    if (digits.indexOf(input[j]) != -1 ){
-      number += input[j];}
-
-    if ((digits.indexOf(input[j]) == -1 ) || (j == input.length()-1)){
-      rgb[count] = number.toInt();
-      number = "";
-      count ++;}}
+void updateColor(byte zone, byte r, byte g, byte b){
+  const byte* pins = zonePins[min(zone, ZONE_COUNT - 1)];
+  analogWrite(pins[0], r);
+  analogWrite(pins[1], g);
+  analogWrite(pins[2], b);
+}
 
-  Serial.println(rgb[0]);
-  Serial.println(rgb[1]);
-  Serial.println(rgb[2]);
+// feeds one byte to the parser, true once rxBuf holds a whole frame with a good crc
+bool readFrame(byte c){
+  if (rxState == 0){
+    rxState = (c == MAGIC_0) ? 1 : 0;
+    return false;}
+  if (rxState == 1){
+    if (c == MAGIC_1){
+      rxState = 2;
+      rxPos = 0;}
+    else {
+      rxState = (c == MAGIC_0) ? 1 : 0;}
+    return false;}
+
+  rxBuf[rxPos++] = c;
+  if (rxPos == 3){
+    if (rxBuf[2] > MAX_PAYLOAD){
+      rxState = 0;
+      return false;}
+    rxNeed = 3 + rxBuf[2] + 2;}
+  if (rxPos < 3 || rxPos < rxNeed){
+    return false;}
+
+  rxState = 0;
+  uint16_t crc = rxBuf[rxNeed - 2] | ((uint16_t)rxBuf[rxNeed - 1] << 8);
+  return crc == crc16(rxBuf, rxNeed - 2, 0xFFFF);
+}
 
-  analogWrite(REDPIN, rgb[0]);
-  analogWrite(BLUEPIN, rgb[2]);
-  analogWrite(GREENPIN, rgb[1]);
+// apply a color frame, every zone at once, then ack it
+void handleFrame(){
+  byte type = rxBuf[0];
+  byte len = rxBuf[2];
+  const byte* payload = rxBuf + 3;
+  byte status = ACK_OK;
+
+  if (type == FRAME_COLORS && len % 4 == 0){
+    for (byte i=0; i<len; i+=4){
+      updateColor(payload[i], payload[i+1], payload[i+2], payload[i+3]);}}
+  else {
+    status = ACK_BAD_PAYLOAD;}
+
+  byte ack[2] = {rxBuf[1], status};
+  sendFrame(FRAME_ACK, ack, 2);
 }
 
 // main loop
-int oldLoopCount = 0;
 void loop() {
 
-  // wait until input, or for new tpa data
-  int smallCounter = oldLoopCount;
-  while((Serial.available() == 0) && (smallCounter < 120)){
-    smallCounter ++;
-    delay(500);}
-
-  // gets color input
-  if (Serial.available() > 0){
-    String line = Serial.readString();
-    updateColor(line);
-    oldLoopCount = smallCounter;
-    }
+  // gets color input as it arrives
+  while (Serial.available() > 0){
+    if (readFrame(Serial.read())){
+      handleFrame();}}
 
   // gets the temp every minute
-  if (smallCounter >= 120){
-    oldLoopCount = 0;
-    temp = getTemp();
-    updateArray(oneHourData, temp, 60);
-    oneHourAvg += temp;
-
-    // handles 12-hour data
-    if (counter == 60){
-      updateArray(twelveHourData, (oneHourAvg / 60), 12);
-      oneHourAvg = 0;
-      counter = 0;}
-    counter ++;
-
-    // prints temp
-    Serial.print("# TEMP DATA # ");
-    Serial.print(temp);
-    Serial.print(" #");
-
-    // prints twelveHourData
-    for(int i=0; i<sizeof(twelveHourData)/sizeof(twelveHourData[0]); i++){
-      Serial.print(" ");
-      Serial.print(twelveHourData[i]);}
-    Serial.println();
-
-
+  if (millis() - lastTemp >= TEMP_INTERVAL){
+    lastTemp += TEMP_INTERVAL;
+    sendTemp();
   }
-}
\ No newline at end of file
+}
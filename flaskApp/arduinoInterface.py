@@ -1,115 +1,208 @@
-from model import Arduino, RGBLightValue, CurrentTemperature, TemperatureData
-import threading
-import datetime
+from model import RGBLightValue
+from datetime import datetime, timedelta
+import selectors
 import serial
+import serialProtocol as protocol
+import metrics
 import time
-import re
 
-class ArduinoInterface(threading.Thread):
+class ArduinoInterface:
+    """One board: its serial port, frame decoder and the color frame in flight.
 
-    def __init__(self, app):
-        super(ArduinoInterface, self).__init__()
-        self.app = app
+    The device manager owns the selector and the loop, and calls in when this
+    board's port is readable or one of its timers is due, so a board costs a
+    file descriptor rather than a thread.
+    """
+
+    ACK_TIMEOUT = 1.5
+    MAX_ATTEMPTS = 3
+    RECONNECT_DELAY = 1
+    MAX_BACKOFF = 300
+
+    def __init__(self, manager, device):
+        self.manager = manager
+        self.writer = manager.writer
+        self.id = device["id"]
+        self.configure(device)
         self.arduino = None
-        with self.app.app_context():
-            TemperatureData.cleanup_excess_entries()
-            CurrentTemperature.cleanup_old_readings()
+        self.decoder = protocol.FrameDecoder()
+        self.seq = 0
+        self.awaiting = None
+        self.pending = False
+        self.chunks = []
+        self.requested_at = None
+
+        # pick up the backoff a previous run left behind
+        self.failures = device["failures"]
+        wait = (device["retry_at"] - datetime.utcnow()).total_seconds() if device["retry_at"] else 0
+        self.next_connect = time.monotonic() + max(wait, 0)
+
+    # name, port, zones and sensor from the board's row
+    def configure(self, device):
+        self.name = device["name"]
+        self.port = device["port"]
+        self.zones = device["zones"]
+        self.sensor = device["sensor"]
 
-    # connects to board
-    def connect(self, port):
+    # whether a change to these zones (None for all) concerns this board
+    def wants(self, zones):
+        return zones is None or self.zones is None or bool(set(zones).intersection(self.zones))
+
+    # connects to board, backing off further after each failed attempt
+    def connect(self):
         try:
-            ard = serial.Serial(port=port, baudrate=9600, timeout=.1)
-            print("Arduino Connected!")
-            with self.app.app_context():
-                Arduino.update_state("update")
-            return ard
+            self.arduino = serial.Serial(port=self.port, baudrate=9600, timeout=0)
+            self.manager.selector.register(self.arduino, selectors.EVENT_READ, self)
         except Exception as e:
-            print(f"No Arduino Connection - port: {port} {e}")
-            return None
+            self.arduino = None
+            self.failures += 1
+            delay = min(self.RECONNECT_DELAY * 2 ** self.failures, self.MAX_BACKOFF)
+            print(f"No Arduino Connection - {self.name} port: {self.port} {e}, retrying in {delay}s")
+            self.writer.put_state(self.id, "offline")
+            self.writer.put_backoff(self.id, self.failures, datetime.utcnow() + timedelta(seconds=delay))
+            self.next_connect = time.monotonic() + delay
+            return False
+        print(f"Arduino Connected! {self.name} on {self.port}")
+        if self.failures:
+            self.failures = 0
+            self.writer.put_backoff(self.id, 0, None)
+        self.writer.put_state(self.id, "update")
+        self.setColors(time.time())
+        return True
+
+    # drop the board and schedule a reconnect
+    def disconnect(self):
+        self.close()
+        self.writer.put_state(self.id, "offline")
+        self.next_connect = time.monotonic() + self.RECONNECT_DELAY
 
-    # set led colors
-    def setColors(self, colorString):
+    def close(self):
         if self.arduino:
             try:
-                self.arduino.write(colorString.encode())
-                time.sleep(1)
-                with self.app.app_context():
-                    Arduino.update_state("online")
-                return
-            except Exception as e:
-                print(f"serial write failed: {e}")
-        print("Could Not Send to Arduino")
+                self.manager.selector.unregister(self.arduino)
+                self.arduino.close()
+            except Exception:
+                pass
         self.arduino = None
-        with self.app.app_context():
-            Arduino.update_state("offline")
-
-    # main loop
-    def run(self):
-        with self.app.app_context():
-            port = Arduino.get_port()
-            self.arduino = self.connect(port)
-
-        # run once a min, at the start of the min
-        while True:
-
-            # look for status changes while waiting for new data
-            while int(time.time()) % 60 != 0:
-                time.sleep(0.8)
-
-                # update colors as needed
-                if Arduino.get_state() == "update":
-                    try:
-                        with self.app.app_context():
-                            c1 = RGBLightValue.get_by_name("zone1").rgb_tuple
-                            c2 = RGBLightValue.get_by_name("zone2").rgb_tuple
-                        c1_out = "".join(str(c).zfill(3) + " " for c in c1) + "0"
-                        c2_out = "".join(str(c).zfill(3) + " " for c in c2) + "1"
-                        print(f"updating colors to be: z1:{c1_out} z2:{c2_out}")
-                        self.setColors(c1_out)
-                        self.setColors(c2_out)
-                    except Exception as e:
-                        print(f"failed to set-colors {e}")
-                        continue
-
-            # when connected, read data 
-            if self.arduino:
-                try:
-                    # parse new temperature data, add to db
-                    line = str(self.arduino.readline())
-                    if line != "b''" and line.startswith("b'# TEMP DATA #") and (len(line) > 60):
-                        new_temp = re.findall(r"[0-9.-]+", line)[0]
-                        with self.app.app_context():
-                            Arduino.update_state("online")
-                            CurrentTemperature.add_temp(new_temp)
-                        print(f"new-temp-data: {new_temp}, {line}")
-                        time.sleep(1)
-                        
-                # detect when connection is lost
-                except Exception as e:
-                    print(f"Read error: {e}")
-                    with self.app.app_context():
-                        Arduino.update_state("offline")
-                    self.arduino = None
-                    
-                # get avg temp for this hour, at the end of the hour
-                if datetime.datetime.now().minute == 59:
-                    try:
-                        total = 0
-                        with self.app.app_context():
-                            db_data = CurrentTemperature.get_last_hour()
-                        for t in db_data:
-                            total += t.current_temp
-                        if len(db_data) > 0:
-                            out = float(int((total / len(db_data))*10))/10
-                            print(f"new-avg-temp: {out}")
-                            with self.app.app_context():
-                                TemperatureData.add_temp(out)
-                            time.sleep(1)
-                    except Exception as e:
-                        print(f"failed to updated hourly temps {e}")
-                    
-            else:
-                with self.app.app_context():
-                    Arduino.update_state("offline")
-                self.arduino = self.connect(port)
-                time.sleep(1)
\ No newline at end of file
+        self.decoder.reset()
+        self.awaiting = None
+        self.pending = False
+        self.chunks = []
+
+    # send this board's zones in one frame, or once the frame in flight is acked
+    def setColors(self, requested_at):
+        self.requested_at = requested_at if self.requested_at is None else min(self.requested_at, requested_at)
+        if self.awaiting:
+            self.pending = True
+        else:
+            self.send_colors()
+
+    # zones are numbered on the board in the order of its zone list, by name without one,
+    # more zones than fit in a frame go out as several, each sent once the last is acked
+    def send_colors(self):
+        zones = RGBLightValue.get_zones()
+        names = self.zones if self.zones is not None else list(zones)
+        colors = [zones[name] for name in names if name in zones]
+        self.pending = False
+        print(f"updating {self.name} colors to be: {colors}")
+        size = protocol.MAX_ZONES
+        self.chunks = [(i, colors[i:i + size]) for i in range(0, max(len(colors), 1), size)]
+        self.send_chunk()
+
+    def send_chunk(self):
+        first, colors = self.chunks.pop(0)
+        self.seq = (self.seq + 1) & 0xFF
+        frame = protocol.encode_colors(self.seq, colors, first)
+        self.awaiting = (self.seq, time.monotonic(), frame, 1)
+        self.write(frame)
+
+    def write(self, frame):
+        try:
+            with metrics.serial_write.time():
+                self.arduino.write(frame)
+        except Exception as e:
+            print(f"serial write failed: {e}")
+            print(f"Could Not Send to Arduino {self.name}")
+            self.disconnect()
+
+    # the board applied (or refused) the frame in flight
+    def colors_done(self):
+        self.awaiting = None
+        if self.chunks and not self.pending:
+            self.send_chunk()
+            return
+        if self.pending:
+            self.send_colors()
+            return
+        if self.requested_at is not None:
+            self.manager.record_latency(round((time.time() - self.requested_at) * 1000, 1))
+            self.requested_at = None
+        self.writer.put_state(self.id, "online")
+
+    # no ack in time, resend the same frame a few times, then drop the board
+    # so it gets its colors afresh once it reconnects
+    def ack_timed_out(self):
+        seq, _, frame, attempts = self.awaiting
+        if attempts >= self.MAX_ATTEMPTS:
+            print(f"no ack from {self.name} for color frame {seq}, reconnecting")
+            self.requested_at = None
+            self.disconnect()
+            return
+        self.awaiting = (seq, time.monotonic(), frame, attempts + 1)
+        self.write(frame)
+
+    # read whatever has arrived and handle each complete frame
+    def read_serial(self):
+        try:
+            with metrics.serial_read.time():
+                data = self.arduino.read(self.arduino.in_waiting or 1)
+        except Exception as e:
+            print(f"Read error on {self.name}: {e}")
+            self.disconnect()
+            return
+        for frame in self.decoder.feed(data):
+            try:
+                self.handle_frame(frame)
+            except Exception as e:
+                print(f"bad frame from {self.name} {frame}: {e}")
+
+    def handle_frame(self, frame):
+
+        # the board acks each color frame once applied
+        if frame.type == protocol.ACK:
+            acked, status = protocol.decode_ack(frame.payload)
+            if self.awaiting and acked == self.awaiting[0]:
+                if status != protocol.ACK_OK:
+                    print(f"{self.name} refused color frame {acked}: status {status}")
+                self.colors_done()
+
+        # new temperature data, kept only from the boards marked as sensors
+        elif frame.type == protocol.TEMP:
+            new_temp = round(protocol.decode_temp(frame.payload), 2)
+            self.writer.put_state(self.id, "online")
+            if self.sensor:
+                self.manager.add_temp(new_temp)
+
+        # the board reset and lost its colors
+        elif frame.type == protocol.HELLO:
+            print(f"{self.name} reset, resending colors")
+            self.awaiting = None
+            self.setColors(time.time())
+
+        elif frame.type == protocol.LOG:
+            print(f"{self.name}: {frame.payload.decode(errors='replace')}")
+
+    # monotonic time this board next needs the loop, None while it is idle
+    def deadline(self):
+        if not self.arduino:
+            return self.next_connect
+        if self.awaiting:
+            return self.awaiting[1] + self.ACK_TIMEOUT
+        return None
+
+    # run whichever timer is due
+    def tick(self, now):
+        if self.awaiting and now - self.awaiting[1] >= self.ACK_TIMEOUT:
+            self.ack_timed_out()
+        if not self.arduino and now >= self.next_connect:
+            self.connect()
@@ -0,0 +1,114 @@
+import statistics
+import subprocess
+import argparse
+import tempfile
+import json
+import sys
+import os
+
+import benchDb
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# runs in a fresh interpreter: import the app like a worker does, then time the
+# first answered request and how long the background warm-up takes
+CHILD = """
+import time, json, sys
+start = time.perf_counter()
+import wsgi
+imported = time.perf_counter() - start
+client = wsgi.app.test_client()
+health = client.get("/healthz")
+first_response = time.perf_counter() - start
+ready = None
+report = None
+deadline = start + float(sys.argv[1])
+while time.perf_counter() < deadline:
+    response = client.get("/readyz")
+    report = response.get_json()
+    if response.status_code == 200:
+        ready = time.perf_counter() - start
+        break
+    time.sleep(0.005)
+print(json.dumps({"import_s": imported, "first_response_s": first_response, "healthz": health.status_code,
+                  "ready_s": ready, "subsystems": report["subsystems"]}))
+"""
+
+# top-level packages by cumulative import time, from -X importtime output
+def slowest_imports(stderr, count=10):
+    totals = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        name = name.strip()
+        if cumulative.strip().isdigit() and "." not in name:
+            totals[name] = max(totals.get(name, 0), int(cumulative) / 1e6)
+    return {name: round(seconds, 3) for name, seconds in sorted(totals.items(), key=lambda kv: -kv[1])[:count]}
+
+def boot_once(env, wait):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", CHILD, str(wait)], cwd=BASE_DIR, env=env,
+                            capture_output=True, text=True)
+    lines = [line for line in result.stdout.splitlines() if line.startswith("{")]
+    if result.returncode != 0 or not lines:
+        raise RuntimeError(f"boot failed: {result.stderr[-2000:]}")
+    run = json.loads(lines[-1])
+    run["imports"] = slowest_imports(result.stderr)
+    return run
+
+def median(values):
+    values = [v for v in values if v is not None]
+    return round(statistics.median(values), 3) if values else None
+
+def run(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, SECRET_KEY=os.environ.get("SECRET_KEY", "bench"),
+                   SENSOR_SPOOL=os.path.join(tmp, "spool", "sensor.jsonl"))
+        if args.unreachable_db:
+            env["DATABASE_URL"] = "postgresql://bench@127.0.0.1:9/bench?connect_timeout=1"
+        else:
+            env["DATABASE_URL"] = args.database_url if args.database_url else "sqlite:///" + os.path.join(tmp, "boot.db")
+            benchDb.setup(env["DATABASE_URL"], port="/dev/null", raw_hours=args.raw_hours, days=args.days)
+        wait = min(args.wait, 2) if args.unreachable_db else args.wait
+        runs = [boot_once(env, wait) for _ in range(args.runs)]
+
+    report = {
+        "database": "unreachable" if args.unreachable_db else ("postgres" if args.database_url else "sqlite"),
+        "runs": args.runs,
+        "import_s": median(r["import_s"] for r in runs),
+        "first_response_s": median(r["first_response_s"] for r in runs),
+        "ready_s": median(r["ready_s"] for r in runs) if all(r["ready_s"] for r in runs) else None,
+        "subsystems": {name: {"state": s["state"], "seconds": median(r["subsystems"][name]["seconds"] for r in runs)}
+                       for name, s in runs[-1]["subsystems"].items()},
+        "imports": runs[-1]["imports"]}
+
+    # the port must answer within the import budget even when the database is down
+    over = []
+    if report["first_response_s"] > args.import_budget:
+        over.append(f"first response {report['first_response_s']}s > {args.import_budget}s")
+    if not args.unreachable_db and (report["ready_s"] is None or report["ready_s"] > args.ready_budget):
+        over.append(f"ready {report['ready_s']}s > {args.ready_budget}s")
+    report["budget"] = {"import_s": args.import_budget, "ready_s": args.ready_budget, "over": over}
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the app from import to first response and to ready, against a budget")
+    parser.add_argument("--database-url", help="an empty postgres database (default: a throwaway sqlite file)")
+    parser.add_argument("--unreachable-db", action="store_true",
+                        help="point at a database that is down, /healthz must still answer right away")
+    parser.add_argument("--runs", type=int, default=3, help="fresh interpreters, the medians are reported")
+    parser.add_argument("--import-budget", type=float, default=1.5, help="seconds to the first answered request")
+    parser.add_argument("--ready-budget", type=float, default=3.0, help="seconds until /readyz answers 200")
+    parser.add_argument("--wait", type=float, default=15, help="seconds to wait for readiness per run")
+    parser.add_argument("--raw-hours", type=int, default=24)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--out", help="write the json report here as well")
+    args = parser.parse_args()
+    report = run(args)
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    if report["budget"]["over"]:
+        print("over budget: " + "; ".join(report["budget"]["over"]), file=sys.stderr)
+        sys.exit(1)
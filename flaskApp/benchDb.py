@@ -0,0 +1,126 @@
+from flask import Flask
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+from datetime import datetime, timedelta
+import argparse
+import random
+import math
+import re
+import os
+
+from model import db, User, Arduino, RGBLightValue, FishOfTheWeek, CurrentTemperature, TemperatureData, TemperatureDaily
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+INIT_DIR = os.path.join(BASE_DIR, 'docker-entrypoint-initdb.d')
+
+FISH_ROW = re.compile(r"\(\s*'((?:[^']|'')*)'\s*,\s*'((?:[^']|'')*)'\s*\)")
+
+# (wiki_url, fish_name) rows from the fish_of_the_week insert in 02_items.sql,
+# first one wins on a repeated url like the script's ON CONFLICT DO NOTHING
+def catalog_rows(init_dir=INIT_DIR):
+    with open(os.path.join(init_dir, "02_items.sql")) as f:
+        sql = f.read()
+    block = sql[sql.index("INSERT INTO fish_of_the_week"):]
+    block = block[:block.index(";")]
+    rows = {}
+    for url, name in FISH_ROW.findall(block):
+        rows.setdefault(url.replace("''", "'"), name.replace("''", "'"))
+    return list(rows.items())
+
+# postgres gets the real init scripts, anything else the models plus the same catalog
+def create_schema(init_dir=INIT_DIR, port="/dev/ttyACM0"):
+    if db.engine.dialect.name == "postgresql":
+        conn = db.engine.raw_connection()
+        try:
+            cursor = conn.cursor()
+            for name in sorted(os.listdir(init_dir)):
+                if name.endswith(".sql"):
+                    with open(os.path.join(init_dir, name)) as f:
+                        cursor.execute(f.read())
+            cursor.execute("UPDATE arduino SET port = %s", (port,))
+            conn.commit()
+        finally:
+            conn.close()
+        return
+    db.create_all()
+    db.session.add(Arduino(name=os.path.basename(port), port=port, state="offline"))
+    db.session.add(RGBLightValue(name="zone1", red=0, green=0, blue=0))
+    db.session.add(RGBLightValue(name="zone2", red=0, green=0, blue=0))
+    db.session.execute(insert(FishOfTheWeek), [
+        {"wiki_url": url, "fish_name": name} for url, name in catalog_rows(init_dir)])
+    db.session.commit()
+
+# extra made-up fish to grow the catalog past the seed list
+def seed_extra_fish(count):
+    if count:
+        db.session.execute(insert(FishOfTheWeek), [
+            {"wiki_url": f"https://example.invalid/fish/{i}", "fish_name": f"Bench fish {i}"} for i in range(count)])
+        db.session.commit()
+
+# the most recent `weeks` weeks each get a fish, newest first by id
+def seed_fish_history(weeks=12):
+    monday = FishOfTheWeek.current_week()
+    fish = FishOfTheWeek.query.order_by(FishOfTheWeek.id).limit(weeks).all()
+    for i, f in enumerate(fish):
+        f.last_chosen_week = monday - timedelta(weeks=i)
+    db.session.commit()
+    return len(fish)
+
+# minute readings for raw_hours, hourly averages and daily rollups for days
+def seed_temperature_history(raw_hours=24, days=30, seed=0):
+    rng = random.Random(seed)
+    now = datetime.utcnow().replace(second=0, microsecond=0)
+    reading = lambda t: round(21.5 + 3 * math.sin(t.timestamp() / 86400 * 2 * math.pi) + rng.gauss(0, 0.2), 2)
+    raw = [{"timestamp": now - timedelta(minutes=m), "current_temp": reading(now - timedelta(minutes=m))}
+           for m in range(raw_hours * 60)]
+    hourly = [{"timestamp": now - timedelta(hours=h), "avg_temp": reading(now - timedelta(hours=h))}
+              for h in range(days * 24)]
+    daily = []
+    for d in range(1, days + 1):
+        temps = [reading(now - timedelta(days=d, hours=h)) for h in range(24)]
+        daily.append({"day": (now - timedelta(days=d)).date(), "avg_temp": round(sum(temps) / 24, 2),
+                      "min_temp": min(temps), "max_temp": max(temps), "sample_count": 24})
+    for model, rows in ((CurrentTemperature, raw), (TemperatureData, hourly), (TemperatureDaily, daily)):
+        for i in range(0, len(rows), 5000):
+            db.session.execute(insert(model), rows[i:i + 5000])
+    db.session.commit()
+    return {"raw": len(raw), "hourly": len(hourly), "daily": len(daily)}
+
+# more boards beside the seeded one, each on its own port driving every zone
+def seed_boards(ports):
+    for port in ports:
+        db.session.add(Arduino(name=os.path.basename(port), port=port, state="offline"))
+    db.session.commit()
+    return Arduino.query.count()
+
+def seed_user(username, password):
+    db.session.add(User(username=username, password_hash=generate_password_hash(password)))
+    db.session.commit()
+
+# builds and fills a local database, the url must point at an empty one
+def setup(url, port="/dev/ttyACM0", raw_hours=24, days=30, fish_weeks=12, extra_fish=0,
+          user=("bench", "bench"), init_dir=INIT_DIR, extra_ports=()):
+    app = Flask("benchDb")
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    db.init_app(app)
+    with app.app_context():
+        create_schema(init_dir, port)
+        seed_extra_fish(extra_fish)
+        counts = {"boards": seed_boards(extra_ports), "fish": FishOfTheWeek.query.count(),
+                  "chosen": seed_fish_history(fish_weeks)}
+        counts.update(seed_temperature_history(raw_hours, days))
+        if user:
+            seed_user(*user)
+        db.session.remove()
+    return counts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create and seed a local database for benchmarks")
+    parser.add_argument("url", help="database url, e.g. sqlite:////tmp/awsite.db or an empty postgres db")
+    parser.add_argument("--raw-hours", type=int, default=24)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--fish-weeks", type=int, default=12)
+    parser.add_argument("--extra-fish", type=int, default=0)
+    args = parser.parse_args()
+    print(setup(args.url, raw_hours=args.raw_hours, days=args.days, fish_weeks=args.fish_weeks,
+                extra_fish=args.extra_fish))
@@ -0,0 +1,187 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from werkzeug.serving import make_server
+from datetime import datetime
+import threading
+import argparse
+import logging
+import platform
+import tempfile
+import requests
+import json
+import time
+import sys
+import io
+import os
+
+from benchSerial import percentiles
+import benchDb
+
+# (method, path) per endpoint, {fish} is filled with a published fish name
+ENDPOINTS = {
+    "main_page": ("GET", "/"),
+    "dashboard": ("GET", "/dashboard"),
+    "api_arduino": ("POST", "/api/arduino"),
+    "api_temperature_24h": ("POST", "/api/temperature?range=24h"),
+    "api_temperature_30d": ("POST", "/api/temperature?range=30d"),
+    "api_fish": ("GET", "/api/fish"),
+    "fish_image": ("GET", "/fish/{fish}.png?w=250"),
+}
+
+class WsgiClient:
+    """Calls the app in-process, measuring the views without a socket"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        return self.client.open(path, method=method, data=data).status_code
+
+class HttpClient:
+    """Calls a server over HTTP, reading each body in full"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.session = requests.Session()
+
+    def request(self, method, path, data=None):
+        response = self.session.request(method, self.base_url + path, data=data, allow_redirects=False)
+        response.content
+        return response.status_code
+
+# cards for the chosen fish, published to a scratch fish dir the routes then serve
+def publish_fish(flask_server, tmp):
+    import numpy as np
+    from PIL import Image
+    import fishCards
+    from fishOfTheWeek import FishOfTheWeek, PublicFish
+    from model import FishOfTheWeek as fishBowl
+    app = flask_server.app
+    static = os.path.join(tmp, "static")
+    os.makedirs(os.path.join(static, "fish", "private"))
+    with app.app_context():
+        chosen = [f.fish_name for f in fishBowl.get_fish()]
+    rng = np.random.default_rng(0)
+    for name in chosen:
+        photo = Image.fromarray(rng.integers(0, 255, size=(300, 500, 3), dtype=np.uint8))
+        fishCards.make_card(photo, name).save(os.path.join(static, "fish", "private", name + ".png"))
+    real_static = app.static_folder
+    app.static_folder = static
+    try:
+        FishOfTheWeek(app).make_fish_img_public()
+    finally:
+        app.static_folder = real_static
+    flask_server.public_fish = PublicFish(os.path.join(static, "fish"))
+    return chosen
+
+def setup_app(tmp, args):
+    url = args.database_url if args.database_url else "sqlite:///" + os.path.join(tmp, "bench.db")
+    os.environ["DATABASE_URL"] = url
+    os.environ["SENSOR_SPOOL"] = os.path.join(tmp, "spool", "sensor.jsonl")
+    os.environ.setdefault("SECRET_KEY", "bench")
+    seeded = benchDb.setup(url, port="/dev/null", raw_hours=args.raw_hours, days=args.days,
+                           extra_fish=args.extra_fish)
+    import flask_server
+    flask_server.app.config.update(WTF_CSRF_ENABLED=False, SESSION_COOKIE_SECURE=False)
+    flask_server.limiter.enabled = False
+    seeded["published"] = publish_fish(flask_server, tmp)
+    return flask_server.app, seeded
+
+def login(client):
+    status = client.request("POST", "/auth_page", {"Username": "bench", "Password": "bench"})
+    if status != 302:
+        raise RuntimeError(f"bench login failed with {status}")
+
+# requests split across concurrent clients, each timing its own calls
+def drive(clients, method, path, total, warmup):
+    for client in clients:
+        for _ in range(warmup):
+            client.request(method, path)
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    share = [total // len(clients) + (i < total % len(clients)) for i in range(len(clients))]
+
+    def worker(client, count):
+        mine = []
+        failed = []
+        for _ in range(count):
+            start = time.perf_counter()
+            try:
+                status = client.request(method, path)
+            except Exception as e:
+                status = repr(e)
+            mine.append((time.perf_counter() - start) * 1000)
+            if not isinstance(status, int) or status >= 400:
+                failed.append(status)
+        with lock:
+            latencies.extend(mine)
+            errors.extend(failed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(clients)) as pool:
+        list(pool.map(worker, clients, share))
+    elapsed = time.perf_counter() - start
+    result = {"requests": total, "errors": len(errors), "rps": round(total / elapsed, 1),
+              "latency_ms": percentiles(latencies)}
+    if errors:
+        result["error_sample"] = [str(e) for e in errors[:5]]
+    return result
+
+def run(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        log = io.StringIO()
+        with redirect_stdout(sys.stdout if args.verbose else log):
+            app, seeded = setup_app(tmp, args)
+            server = None
+            if args.mode == "http":
+                logging.getLogger("werkzeug").setLevel(logging.WARNING if args.verbose else logging.ERROR)
+                server = make_server("127.0.0.1", 0, app, threaded=True)
+                threading.Thread(target=server.serve_forever, daemon=True).start()
+                make_client = lambda: HttpClient(f"http://127.0.0.1:{server.server_port}")
+            else:
+                make_client = lambda: WsgiClient(app)
+            clients = [make_client() for _ in range(args.concurrency)]
+            for client in clients:
+                login(client)
+
+            results = {}
+            for name in args.endpoints:
+                method, path = ENDPOINTS[name]
+                path = path.format(fish=requests.utils.quote(seeded["published"][0]))
+                results[name] = drive(clients, method, path, args.requests, args.warmup)
+            if server:
+                server.shutdown()
+
+    return {
+        "generated_at": datetime.utcnow().isoformat() + "Z",
+        "python": platform.python_version(),
+        "config": {"mode": args.mode, "concurrency": args.concurrency, "requests": args.requests,
+                   "warmup": args.warmup, "database": "postgres" if args.database_url else "sqlite"},
+        "seeded": {k: (len(v) if isinstance(v, list) else v) for k, v in seeded.items()},
+        "endpoints": results}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load benchmark for the site's endpoints against a seeded local database")
+    parser.add_argument("--mode", choices=["wsgi", "http"], default="wsgi",
+                        help="wsgi calls the app in-process, http goes through a local threaded server")
+    parser.add_argument("--database-url", help="an empty postgres database, seeded from docker-entrypoint-initdb.d "
+                                               "(default: a throwaway sqlite file)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=500, help="per endpoint")
+    parser.add_argument("--warmup", type=int, default=5, help="per client, per endpoint")
+    parser.add_argument("--raw-hours", type=int, default=24, help="minute readings to seed")
+    parser.add_argument("--days", type=int, default=30, help="hourly and daily history to seed")
+    parser.add_argument("--extra-fish", type=int, default=0, help="synthetic fish added to the catalog")
+    parser.add_argument("--endpoints", nargs="+", choices=list(ENDPOINTS), default=list(ENDPOINTS))
+    parser.add_argument("--out", default="bench_http.json", help="where to write the json report")
+    parser.add_argument("--verbose", action="store_true", help="show the app's own output")
+    args = parser.parse_args()
+    report = run(args)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    for name, result in report["endpoints"].items():
+        latency = result["latency_ms"]
+        print(f"{name:22} {result['rps']:8.1f} req/s  p50 {latency['p50']:7.1f} ms  "
+              f"p99 {latency['p99']:7.1f} ms  errors {result['errors']}")
+    print(f"report written to {args.out}")
@@ -0,0 +1,156 @@
+from contextlib import redirect_stdout
+import statistics
+import argparse
+import shutil
+import tempfile
+import json
+import time
+import sys
+import io
+import os
+
+from virtualArduino import VirtualArduino
+import benchDb
+
+def percentiles(samples):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {"count": len(ordered), "p50": round(statistics.median(ordered), 1),
+            "p90": round(pick(0.90), 1), "p99": round(pick(0.99), 1), "max": round(ordered[-1], 1)}
+
+def wait_for(check, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if check():
+            return True
+        time.sleep(0.005)
+    return False
+
+# throwaway sqlite database with one board per virtual port, then the app
+def setup_app(tmp, ports):
+    url = "sqlite:///" + os.path.join(tmp, "bench.db")
+    os.environ["DATABASE_URL"] = url
+    os.environ["SENSOR_SPOOL"] = os.path.join(tmp, "spool", "sensor.jsonl")
+    os.environ["HOURLY_STATE"] = os.path.join(tmp, "spool", "hourly.json")
+    os.environ.setdefault("SECRET_KEY", "bench")
+    benchDb.setup(url, port=ports[0], raw_hours=0, days=0, fish_weeks=0, user=None, extra_ports=ports[1:])
+    from flask_server import app
+    return app
+
+def connected(manager, devices):
+    boards = list(manager.devices.values())
+    return (len(boards) == len(devices) and all(board.arduino and not board.awaiting for board in boards)
+            and all(device.stats["acks"] > 0 for device in devices))
+
+# readings/s the devices send and the manager commits, noise included
+def bench_ingest(app, manager, devices, seconds):
+    from model import CurrentTemperature
+    manager.writer.flush()
+    with app.app_context():
+        before = CurrentTemperature.query.count()
+    sent = sum(device.stats["temps"] for device in devices)
+    dropped = sum(board.decoder.dropped for board in manager.devices.values())
+    start = time.monotonic()
+    time.sleep(seconds)
+    sent = sum(device.stats["temps"] for device in devices) - sent
+    elapsed = time.monotonic() - start
+
+    # let the last frames on the wire arrive before counting
+    time.sleep(0.2)
+    manager.writer.flush()
+    with app.app_context():
+        ingested = min(sent, CurrentTemperature.query.count() - before)
+    return {"seconds": round(elapsed, 2), "sent": sent, "ingested": ingested,
+            "readings_per_s": round(ingested / elapsed, 1), "lost": max(0, sent - ingested),
+            "noise_bytes_skipped": sum(board.decoder.dropped for board in manager.devices.values()) - dropped}
+
+# dashboard click until every board has acked, one click at a time
+def bench_latency(app, manager, clicks):
+    from model import Arduino
+    from arduinoInterface import ArduinoInterface
+    samples = manager.latency_samples
+    boards = len(manager.devices)
+    samples.clear()
+    timeouts = 0
+    results = []
+    for _ in range(clicks):
+        with app.app_context():
+            Arduino.request_colors()
+        if wait_for(lambda: len(samples) >= boards, ArduinoInterface.ACK_TIMEOUT * ArduinoInterface.MAX_ATTEMPTS + 1):
+            results.append(max(samples))
+        else:
+            timeouts += 1
+        samples.clear()
+    return {"click_to_ack_ms": percentiles(results), "timeouts": timeouts}
+
+# unplug the first board, replug after downtime, time until it has its colors again
+def bench_reconnect(manager, devices, rounds, downtime):
+    from arduinoInterface import ArduinoInterface
+    device = devices[0]
+    colored = []
+    device.on_colors = lambda seq, zones: colored.append(time.monotonic())
+    times = []
+    failures = 0
+    for _ in range(rounds):
+        wait_for(lambda: connected(manager, devices), 5)
+        colored.clear()
+        unplugged = time.monotonic()
+        device.unplug(downtime)
+        if wait_for(lambda: colored, downtime + ArduinoInterface.RECONNECT_DELAY * 4 + 10):
+            times.append((colored[0] - unplugged) * 1000)
+        else:
+            failures += 1
+    device.on_colors = None
+    return {"downtime_ms": downtime * 1000, "unplug_to_colors_ms": percentiles(times), "failures": failures}
+
+def run(args):
+
+    # the manager keeps writing its spool until exit, so clean up leniently
+    tmp = tempfile.mkdtemp()
+    try:
+        devices = [VirtualArduino(os.path.join(tmp, f"arduino{i}"), speed=args.speed, baud=args.baud,
+                                  boot_delay=args.boot_delay, garbage_rate=args.garbage_rate, seed=i)
+                   for i in range(args.boards)]
+        log = io.StringIO()
+        with redirect_stdout(sys.stdout if args.verbose else log):
+            app = setup_app(tmp, [device.path for device in devices])
+            from deviceManager import DeviceManager
+            for device in devices:
+                device.start()
+            manager = DeviceManager(app, patterns="")
+            manager.start()
+            wait_for(lambda: connected(manager, devices), 10 + args.boards)
+            report = {
+                "device": {"boards": args.boards, "speed": args.speed, "baud": args.baud,
+                           "garbage_rate": args.garbage_rate},
+                "ingest": bench_ingest(app, manager, devices, args.seconds),
+                "latency": bench_latency(app, manager, args.clicks),
+                "reconnect": bench_reconnect(manager, devices, args.reconnects, args.downtime)}
+            report["device"]["stats"] = {key: sum(device.stats[key] for device in devices) for key in devices[0].stats}
+            for device in devices:
+                device.stop()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serial ingest, latency and reconnect benchmark against virtual arduinos")
+    parser.add_argument("--boards", type=int, default=1, help="virtual boards run by the one device manager")
+    parser.add_argument("--speed", type=float, default=3000, help="device clock multiplier, 3000 is 50 readings/s")
+    parser.add_argument("--baud", type=int, default=9600)
+    parser.add_argument("--boot-delay", type=float, default=2.0, help="device seconds before HELLO after a replug")
+    parser.add_argument("--garbage-rate", type=float, default=0.05)
+    parser.add_argument("--seconds", type=float, default=10, help="length of the ingest run")
+    parser.add_argument("--clicks", type=int, default=50)
+    parser.add_argument("--reconnects", type=int, default=3)
+    parser.add_argument("--downtime", type=float, default=0.5, help="seconds the device stays unplugged")
+    parser.add_argument("--out", help="write the json report here as well")
+    parser.add_argument("--verbose", action="store_true", help="show the interface's own output")
+    args = parser.parse_args()
+    report = run(args)
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,94 @@
+import argparse
+import hashlib
+import gzip
+import json
+import os
+import re
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+SOURCE_DIRS = ("css", "js")
+MANIFEST = "manifest.json"
+
+# already compressed formats are only hashed
+COMPRESSIBLE = (".css", ".js", ".json", ".svg", ".html", ".txt")
+
+CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+def hashed_name(path, content):
+    base, ext = os.path.splitext(path)
+    return f"{base}.{hashlib.sha1(content).hexdigest()[:10]}{ext}"
+
+# point relative url()s in a stylesheet at the hashed copies next to it
+def rewrite_css(path, content, manifest):
+    folder = os.path.dirname(path)
+    def replace(match):
+        quote, url = match.groups()
+        if url.startswith(("data:", "http:", "https:", "/", "#")):
+            return match.group(0)
+        target = os.path.normpath(os.path.join(folder, url)).replace(os.sep, "/")
+        if target not in manifest:
+            return match.group(0)
+        return f"url({quote}{os.path.relpath(manifest[target], folder).replace(os.sep, '/')}{quote})"
+    return CSS_URL.sub(replace, content.decode()).encode()
+
+# writes the .gz/.br siblings, skipping any that would not be smaller
+def compress(out_path, content):
+    written = []
+    variants = [(".gz", lambda: gzip.compress(content, compresslevel=9, mtime=0))]
+    if brotli:
+        variants.append((".br", lambda: brotli.compress(content, quality=11)))
+    for suffix, encode in variants:
+        encoded = encode()
+        if len(encoded) < len(content):
+            with open(out_path + suffix, "wb") as f:
+                f.write(encoded)
+            written.append(suffix)
+    return written
+
+# copy every css/js asset into dist under a content-hashed name, with
+# precompressed siblings and a manifest of {source path: hashed path}
+def build(static_dir=STATIC_DIR, dist_dir=DIST_DIR):
+    sources = []
+    for folder in SOURCE_DIRS:
+        for root, _, filenames in os.walk(os.path.join(static_dir, folder)):
+            for filename in sorted(filenames):
+                sources.append(os.path.relpath(os.path.join(root, filename), static_dir).replace(os.sep, "/"))
+
+    # stylesheets last so the files they point at are already hashed
+    sources.sort(key=lambda path: (path.endswith(".css"), path))
+    manifest = {}
+    total = packed = 0
+    for path in sources:
+        with open(os.path.join(static_dir, path), "rb") as f:
+            content = f.read()
+        if path.endswith(".css"):
+            content = rewrite_css(path, content, manifest)
+        manifest[path] = hashed_name(path, content)
+        out_path = os.path.join(dist_dir, manifest[path])
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        with open(out_path, "wb") as f:
+            f.write(content)
+        total += len(content)
+        encodings = compress(out_path, content) if path.endswith(COMPRESSIBLE) else []
+        smallest = min([os.path.getsize(out_path + e) for e in encodings] + [len(content)])
+        packed += smallest
+        print(f"{path} -> {manifest[path]} {len(content)}B -> {smallest}B {' '.join(encodings)}")
+
+    with open(os.path.join(dist_dir, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"built {len(manifest)} assets, {total}B -> {packed}B{'' if brotli else ' (no brotli)'}")
+    return manifest
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hash and precompress static assets")
+    parser.add_argument("--static-dir", default=STATIC_DIR)
+    parser.add_argument("--dist-dir", default=DIST_DIR)
+    args = parser.parse_args()
+    build(args.static_dir, args.dist_dir)
@@ -0,0 +1,223 @@
+from model import Arduino, RGBLightValue, colors_requested, notify, db
+from arduinoInterface import ArduinoInterface
+from hourlyAggregator import HourlyAggregator
+from writeBehind import WriteBehind
+from readiness import READINESS
+from collections import deque
+import statistics
+import selectors
+import threading
+import metrics
+import queue
+import glob
+import time
+import os
+
+class CommandQueue:
+    """Thread-safe queue whose fileno() turns readable when a command is waiting"""
+
+    def __init__(self):
+        self.queue = queue.SimpleQueue()
+        self.read_fd, self.write_fd = os.pipe()
+        os.set_blocking(self.read_fd, False)
+        os.set_blocking(self.write_fd, False)
+
+    def fileno(self):
+        return self.read_fd
+
+    def put(self, command):
+        self.queue.put(command)
+        try:
+            os.write(self.write_fd, b"\0")
+        except BlockingIOError:
+            pass
+
+    # take every waiting command and clear the wakeup pipe
+    def drain(self):
+        try:
+            while os.read(self.read_fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        commands = []
+        while True:
+            try:
+                commands.append(self.queue.get_nowait())
+            except queue.Empty:
+                return commands
+
+class DeviceManager(threading.Thread):
+    """Runs every board in the arduino table from one thread.
+
+    All serial ports and the dashboard's command queue sit on one selector,
+    and the loop wakes only for data, a command, or the earliest timer of any
+    board, so adding boards adds file descriptors rather than threads. New
+    serial ports matching ARDUINO_PORTS are added to the table as unconfigured
+    boards, and rows added or changed there are picked up on the next sync.
+    """
+
+    # color requests from the dashboard: (time of the click, zones or None for all)
+    commands = CommandQueue()
+
+    # click-to-LED latency in ms for the most recent color updates, measured
+    # here in the leader and sent on to every other worker
+    latency_samples = deque(maxlen=100)
+
+    SYNC_INTERVAL = 30
+    LATENCY_INTERVAL = 1
+
+    def __init__(self, app, patterns=None):
+        super(DeviceManager, self).__init__()
+        self.app = app
+        self.daemon = True
+        self.writer = WriteBehind(app)
+        self.hourly = HourlyAggregator(os.getenv(
+            "HOURLY_STATE", os.path.join(app.root_path, "spool", "hourly.json")), self.put_hourly)
+        self.selector = selectors.DefaultSelector()
+        self.devices = {}
+        patterns = patterns if patterns is not None else os.getenv("ARDUINO_PORTS", "/dev/ttyACM*,/dev/ttyUSB*")
+        self.patterns = [pattern.strip() for pattern in patterns.split(",") if pattern.strip()]
+        self.next_sync = 0
+        self.unpublished = []
+        self.next_latency = 0
+        colors_requested.connect(self.on_colors_requested, weak=False)
+
+    # queue a color update, sent by the dashboard from any process
+    def on_colors_requested(self, sender, requested_at, zones=None):
+        self.commands.put((requested_at, zones))
+
+    def record_latency(self, ms):
+        self.latency_samples.append(ms)
+        self.unpublished.append(ms)
+
+    # send the samples measured since last time to the other workers, at most once per interval
+    def publish_latency(self):
+        if not self.unpublished or time.monotonic() < self.next_latency:
+            return
+        samples, self.unpublished = self.unpublished, []
+        self.next_latency = time.monotonic() + self.LATENCY_INTERVAL
+        with self.app.app_context():
+            if notify("latency", samples=samples):
+                db.session.commit()
+
+    @classmethod
+    def latency_stats(cls):
+        samples = list(cls.latency_samples)
+        if not samples:
+            return None
+        return {
+            "last": samples[-1],
+            "p50": round(statistics.median(samples), 1),
+            "max": max(samples),
+            "count": len(samples)}
+
+    # a reading from a sensor board, rolled into the hourly aggregate as it arrives
+    def add_temp(self, temp):
+        self.writer.put_temp(temp)
+        print(f"new-temp-data: {temp}")
+        self.hourly.add(temp)
+
+    # spool the rollup of an hour the aggregator is closing
+    def put_hourly(self, rollup):
+        print(f"new-avg-temp: {rollup['avg']} over {rollup['count']} readings")
+        self.writer.put_hourly(rollup)
+
+    # add boards for new ports, then match the boards run here to the table
+    def sync(self):
+        self.next_sync = time.monotonic() + self.SYNC_INTERVAL
+        ports = sorted({port for pattern in self.patterns for port in glob.glob(pattern)})
+        with self.app.app_context():
+            RGBLightValue.get_zones()
+            if ports:
+                added = Arduino.discover(ports)
+                if added:
+                    print(f"discovered boards on {', '.join(added)}")
+
+            # rows edited in the table since the last sync, the states this loop owns stay as cached
+            Arduino.refresh_cache(keep_state=True)
+            devices = {device["id"]: device for device in Arduino.get_devices()}
+
+        for device_id in set(self.devices) - set(devices):
+            print(f"board {self.devices[device_id].name} removed")
+            self.devices.pop(device_id).close()
+        for device_id, device in devices.items():
+            board = self.devices.get(device_id)
+            if board is None:
+                self.devices[device_id] = ArduinoInterface(self, device)
+                continue
+
+            # a moved board reconnects on its new port, new zones get their colors
+            port, zones = board.port, board.zones
+            board.configure(device)
+            if board.port != port and board.arduino:
+                board.close()
+                board.next_connect = time.monotonic()
+            elif board.zones != zones and board.arduino:
+                board.setColors(time.time())
+
+    # hand each board the earliest click among the commands touching its zones
+    def dispatch(self, commands):
+        for board in self.devices.values():
+            wanted = [requested_at for requested_at, zones in commands if board.wants(zones)]
+            if board.arduino and wanted:
+                try:
+                    board.setColors(min(wanted))
+                except Exception as e:
+                    print(f"failed to set-colors on {board.name} {e}")
+
+    # how long select may block before a timer is due
+    def next_timeout(self):
+        now = time.monotonic()
+        timeout = min(3600 - (time.time() % 3600), self.next_sync - now)
+        if self.unpublished:
+            timeout = min(timeout, self.next_latency - now)
+        for board in self.devices.values():
+            deadline = board.deadline()
+            if deadline is not None:
+                timeout = min(timeout, deadline - now)
+        return max(timeout, 0)
+
+    # main loop, wakes on serial data, dashboard commands or the next timer
+    def run(self):
+        self.writer.start()
+        self.selector.register(self.commands, selectors.EVENT_READ, "commands")
+        try:
+            with READINESS.step("devices", required=False):
+                self.sync()
+        except Exception as e:
+            print(f"failed to sync boards {e}")
+
+        while True:
+            if time.monotonic() >= self.next_sync:
+                try:
+                    self.sync()
+                except Exception as e:
+                    print(f"failed to sync boards {e}")
+
+            events = self.selector.select(self.next_timeout())
+            woke = time.perf_counter()
+            for key, _ in events:
+                if key.data == "commands":
+                    commands = self.commands.drain()
+                    if commands:
+                        self.dispatch(commands)
+                elif key.data.arduino:
+                    key.data.read_serial()
+
+            now = time.monotonic()
+            for board in list(self.devices.values()):
+                try:
+                    board.tick(now)
+                except Exception as e:
+                    print(f"failed to run timers of {board.name} {e}")
+
+            # a rollup that can't be spooled stays in the aggregator and is retried next wake
+            try:
+                self.hourly.tick()
+            except Exception as e:
+                print(f"failed to close the hourly aggregate {e}")
+            try:
+                self.publish_latency()
+            except Exception as e:
+                print(f"failed to publish color latency {e}")
+            metrics.arduino_loop.observe(time.perf_counter() - woke)
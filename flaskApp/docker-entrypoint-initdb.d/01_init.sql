@@ -10,39 +10,42 @@ CREATE TABLE IF NOT EXISTS temperature_data (
     id SERIAL PRIMARY KEY,
     timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     avg_temp FLOAT NOT NULL,
+    min_temp FLOAT,
+    max_temp FLOAT,
+    stddev_temp FLOAT,
+    sample_count INTEGER,
     CONSTRAINT check_temp_range CHECK (avg_temp >= -150 AND avg_temp <= 250)
 );
 CREATE INDEX IF NOT EXISTS idx_temperature_timestamp ON temperature_data(timestamp DESC);
 
--- trigger function to maintain 24-entry limit
-CREATE OR REPLACE FUNCTION maintain_avg_temp_limit()
-RETURNS TRIGGER AS $$
-BEGIN
-    -- Delete oldest entries if we exceed 24
-    DELETE FROM temperature_data
-    WHERE id IN (
-        SELECT id FROM temperature_data
-        ORDER BY timestamp DESC
-        OFFSET 24
-    );
-    RETURN NEW;
-END;
-$$ LANGUAGE plpgsql;
+-- per-hour spread from the streaming aggregator, null on rows written before it
+ALTER TABLE temperature_data ADD COLUMN IF NOT EXISTS min_temp FLOAT;
+ALTER TABLE temperature_data ADD COLUMN IF NOT EXISTS max_temp FLOAT;
+ALTER TABLE temperature_data ADD COLUMN IF NOT EXISTS stddev_temp FLOAT;
+ALTER TABLE temperature_data ADD COLUMN IF NOT EXISTS sample_count INTEGER;
 
--- trigger to automatically remove old entries
+-- hourly rows are pruned by age in the background, drop the old 24-entry trigger
 DROP TRIGGER IF EXISTS trigger_maintain_avg_temp_limit ON temperature_data;
-CREATE TRIGGER trigger_maintain_avg_temp_limit
-    AFTER INSERT ON temperature_data
-    FOR EACH STATEMENT
-    EXECUTE FUNCTION maintain_avg_temp_limit();
+DROP FUNCTION IF EXISTS maintain_avg_temp_limit();
 
--- current temperature table (stores only the latest reading)
+-- daily temperature rollups
+CREATE TABLE IF NOT EXISTS temperature_daily (
+    id SERIAL PRIMARY KEY,
+    day DATE UNIQUE NOT NULL,
+    avg_temp FLOAT NOT NULL,
+    min_temp FLOAT NOT NULL,
+    max_temp FLOAT NOT NULL,
+    sample_count INTEGER NOT NULL
+);
+
+-- current temperature table (raw minute readings)
 CREATE TABLE IF NOT EXISTS current_temperature (
     id SERIAL PRIMARY KEY,
     timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     current_temp FLOAT NOT NULL,
     CONSTRAINT check_current_temp_range CHECK (current_temp >= -150 AND current_temp <= 250)
 );
+CREATE INDEX IF NOT EXISTS idx_current_temperature_timestamp ON current_temperature(timestamp DESC);
 
 -- rgb light values table
 CREATE TABLE IF NOT EXISTS rgb_light_vals (
@@ -62,9 +65,22 @@ CREATE TABLE IF NOT EXISTS fish_of_the_week (
 );
 CREATE INDEX IF NOT EXISTS idx_fish_last_chosen ON fish_of_the_week(last_chosen_week);
 
--- arduino state table
+-- one row per board: zones lists the rgb_light_vals it drives in board order
+-- (NULL drives every zone), sensor marks the boards feeding the temperature
+-- history, failures and retry_at hold the reconnect backoff across restarts
 CREATE TABLE IF NOT EXISTS arduino (
     id SERIAL PRIMARY KEY,
-    port VARCHAR(100) NOT NULL,
-    state VARCHAR(20) NOT NULL CHECK (state IN ('offline', 'online', 'update'))
+    name VARCHAR(100) UNIQUE,
+    port VARCHAR(100) UNIQUE NOT NULL,
+    state VARCHAR(20) NOT NULL CHECK (state IN ('offline', 'online', 'update')),
+    zones TEXT,
+    sensor BOOLEAN NOT NULL DEFAULT TRUE,
+    failures INTEGER NOT NULL DEFAULT 0,
+    retry_at TIMESTAMP NULL
 );
+ALTER TABLE arduino ADD COLUMN IF NOT EXISTS name VARCHAR(100) UNIQUE;
+ALTER TABLE arduino ADD COLUMN IF NOT EXISTS zones TEXT;
+ALTER TABLE arduino ADD COLUMN IF NOT EXISTS sensor BOOLEAN NOT NULL DEFAULT TRUE;
+ALTER TABLE arduino ADD COLUMN IF NOT EXISTS failures INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE arduino ADD COLUMN IF NOT EXISTS retry_at TIMESTAMP NULL;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_arduino_port ON arduino(port);
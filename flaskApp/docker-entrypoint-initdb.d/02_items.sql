@@ -1,6 +1,6 @@
 -- Seed arduino state (set to offline initially)
-INSERT INTO arduino (port, state) 
-VALUES ('/dev/ttyACM0', 'offline')
+INSERT INTO arduino (name, port, state)
+VALUES ('arduino', '/dev/ttyACM0', 'offline')
 ON CONFLICT DO NOTHING;
 
 -- Seed current temperature (initial reading)
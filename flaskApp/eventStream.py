@@ -0,0 +1,67 @@
+from model import arduino_state_changed, temperature_added
+import threading
+import queue
+import json
+
+class EventStream:
+    """Fans device events out to every open dashboard as server-sent events.
+
+    Each event is encoded once and handed to every subscriber's queue, so a
+    change costs the same no matter how many tabs are listening. The latest
+    event of each kind is replayed to new subscribers.
+    """
+
+    def __init__(self, heartbeat=15, max_backlog=100):
+        self.heartbeat = heartbeat
+        self.max_backlog = max_backlog
+        self.lock = threading.Lock()
+        self.clients = set()
+        self.last = {}
+        arduino_state_changed.connect(self.on_state, weak=False)
+        temperature_added.connect(self.on_temperature, weak=False)
+
+    def on_state(self, sender, state):
+        self.publish("status", {"status": state})
+
+    def on_temperature(self, sender, temp, hourly):
+        ct = round((temp * (9/5) + 32), 1) if temp is not None else None
+        self.publish("temperature", {"ct": ct, "hourly": hourly})
+
+    # encode once and queue for every client, dropping clients that stopped reading
+    def publish(self, event, data):
+        message = f"event: {event}\ndata: {json.dumps(data)}\n\n".encode()
+        with self.lock:
+            self.last[event] = message
+            for client in list(self.clients):
+                try:
+                    client.put_nowait(message)
+                except queue.Full:
+                    self.clients.discard(client)
+
+    def subscribe(self):
+        client = queue.Queue(maxsize=self.max_backlog)
+        with self.lock:
+            for message in self.last.values():
+                client.put_nowait(message)
+            self.clients.add(client)
+        return client
+
+    def unsubscribe(self, client):
+        with self.lock:
+            self.clients.discard(client)
+
+    # generator for a streaming response, sends a comment line while idle
+    def stream(self, first=None):
+        client = self.subscribe()
+        try:
+            if first:
+                yield first
+            while True:
+                try:
+                    yield client.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    if client not in self.clients:
+                        return
+                    yield b": keepalive\n\n"
+        finally:
+            self.unsubscribe(client)
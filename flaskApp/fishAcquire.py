@@ -0,0 +1,390 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urljoin, urlsplit, urlunsplit, unquote
+from requests.adapters import HTTPAdapter
+from model import FishOfTheWeek as fishBowl, db
+from bs4 import BeautifulSoup
+from flask import Flask
+import threading
+import argparse
+import tempfile
+import requests
+import hashlib
+import random
+import shutil
+import json
+import time
+import os
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FISH_DIR = os.path.join(BASE_DIR, 'static', 'fish')
+RAW_DIR = os.path.join(FISH_DIR, 'raw')
+
+# progress is local state like the other spools, nothing under static/ is private
+CHECKPOINT_PATH = os.getenv("FISH_ACQUIRE_CHECKPOINT", os.path.join(BASE_DIR, 'spool', 'fish-acquire.json'))
+
+USER_AGENT = "awsite-fish-of-the-week/1.0 (python-requests)"
+SOURCE_EXTS = (".jpg", ".jpeg", ".png", ".webp", ".gif")
+
+# thumbnails of these are swapped for the full size original
+ORIGINAL_EXTS = (".jpg", ".jpeg")
+
+# full size url for a wiki thumbnail: .../thumb/a/ab/Name.jpg/250px-Name.jpg -> .../a/ab/Name.jpg
+def original_image(src):
+    scheme, netloc, path, query, fragment = urlsplit(src)
+    parts = path.split("/")
+    if "thumb" in parts[:-2] and parts[-2].lower().endswith(ORIGINAL_EXTS):
+        parts.remove("thumb")
+        return urlunsplit((scheme, netloc, "/".join(parts[:-1]), "", ""))
+    return src
+
+# first photo on a wiki page, skipping png logos and icons
+def image_link(html, page_url):
+    soup = BeautifulSoup(html, "html.parser")
+    for img in soup.select("a.mw-file-description img[src]"):
+        src = urljoin(page_url, img["src"])
+        if ".png" not in urlsplit(src).path.lower():
+            return original_image(src)
+    return None
+
+def image_ext(url):
+    ext = os.path.splitext(unquote(urlsplit(url).path))[1].lower()
+    return ext if ext in SOURCE_EXTS else ".jpg"
+
+# one keep-alive pool per host, as many connections as there are workers
+def make_session(workers):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["User-Agent"] = USER_AGENT
+    return session
+
+class HostLimiter:
+    """Spaces out the requests to each host, shared by every worker.
+
+    Each request takes the next free slot for its host, so the rate holds no
+    matter how many workers are waiting, and a host asking us to back off
+    pushes every later slot back.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.lock = threading.Lock()
+        self.next_slot = {}
+
+    def wait(self, url):
+        host = urlsplit(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, 0))
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def hold(self, url, seconds):
+        host = urlsplit(url).netloc
+        with self.lock:
+            self.next_slot[host] = max(self.next_slot.get(host, 0), time.monotonic() + seconds)
+
+class FishAcquirer:
+    """Downloads the wiki photo of every fish into the raw folder fishCards.py renders from.
+
+    Fish are fetched by a bounded pool of workers sharing one pooled session,
+    with each host (the wiki pages and the image server) held to its own
+    request rate. Busy or failing hosts are retried with backoff, honouring
+    Retry-After, without stalling the other workers. Images are written
+    beside their final name and renamed into place, and the outcome of every
+    fish is kept in a checkpoint file, so a rerun skips fish that already
+    have an image or whose page has none and retries only the ones that failed.
+    """
+
+    MAX_ATTEMPTS = 4
+    RETRY_STATUS = (429, 500, 502, 503, 504)
+    TIMEOUT = (5, 30)
+    SAVE_INTERVAL = 2
+    CHUNK = 64 * 1024
+
+    def __init__(self, raw_dir=RAW_DIR, checkpoint_path=CHECKPOINT_PATH, workers=8, rate=5,
+                 retry_delay=2, retry_missing=False):
+        self.raw_dir = raw_dir
+        self.checkpoint_path = checkpoint_path
+        self.workers = workers
+        self.retry_delay = retry_delay
+        self.retry_missing = retry_missing
+        self.session = make_session(workers)
+        self.limiter = HostLimiter(rate)
+        self.checkpoint = {}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.checkpoint_path) as f:
+                self.checkpoint = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"starting a new fish checkpoint: {e}")
+
+    # write the checkpoint beside itself and rename it over, so a crash never leaves half a file
+    def save(self):
+        os.makedirs(os.path.dirname(self.checkpoint_path), exist_ok=True)
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.checkpoint, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    # a response that isn't a retryable error, None once every attempt failed
+    def get(self, url, **kwargs):
+        for attempt in range(self.MAX_ATTEMPTS):
+            self.limiter.wait(url)
+            delay = self.retry_delay * 2 ** attempt
+            try:
+                response = self.session.get(url, timeout=self.TIMEOUT, **kwargs)
+            except requests.RequestException as e:
+                print(f"request failed ({attempt + 1}/{self.MAX_ATTEMPTS}): {url} {e}")
+            else:
+                if response.status_code not in self.RETRY_STATUS:
+                    return response
+                retry_after = response.headers.get("Retry-After", "")
+                delay = float(retry_after) if retry_after.isdigit() else delay
+                print(f"status {response.status_code} ({attempt + 1}/{self.MAX_ATTEMPTS}): {url}")
+                response.close()
+            self.limiter.hold(url, delay)
+        return None
+
+    # (status, checkpoint entry): done, missing when the wiki has no photo, failed to retry next run
+    def acquire_one(self, name, wiki_url):
+        page = self.get(wiki_url)
+        if page is None or (not page.ok and page.status_code != 404):
+            return "failed", {"page": wiki_url}
+        if page.status_code == 404:
+            return "missing", {"page": wiki_url, "reason": "no page"}
+        link = image_link(page.text, page.url)
+        if not link:
+            return "missing", {"page": wiki_url, "reason": "no image"}
+
+        image = self.get(link, stream=True)
+        if image is None or not image.ok:
+            if image is not None:
+                image.close()
+            if image is not None and image.status_code == 404:
+                return "missing", {"page": wiki_url, "image": link, "reason": "no image file"}
+            return "failed", {"page": wiki_url, "image": link}
+        filename = name + image_ext(link)
+        path = os.path.join(self.raw_dir, filename)
+        tmp_path = path + ".part"
+        try:
+            with image, open(tmp_path, "wb") as f:
+                for chunk in image.iter_content(self.CHUNK):
+                    f.write(chunk)
+        except requests.RequestException as e:
+            print(f"image download failed: {link} {e}")
+            os.remove(tmp_path)
+            return "failed", {"page": wiki_url, "image": link}
+        os.replace(tmp_path, path)
+        return "done", {"page": wiki_url, "image": link, "file": filename}
+
+    # fish still needing an image: no raw file yet, and not known to have no photo
+    def pending(self, fish):
+        have = {os.path.splitext(f)[0] for f in os.listdir(self.raw_dir) if f.lower().endswith(SOURCE_EXTS)}
+        return [(name, url) for name, url in fish if name not in have and (
+            self.retry_missing or self.checkpoint.get(name, {}).get("status") != "missing")]
+
+    # fetch every pending fish of [(name, wiki_url)], returns the counts
+    def run(self, fish):
+        os.makedirs(self.raw_dir, exist_ok=True)
+        todo = self.pending(fish)
+        counts = {"fish": len(fish), "skipped": len(fish) - len(todo), "done": 0, "missing": 0, "failed": 0}
+        start = time.perf_counter()
+        saved = start
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            futures = {pool.submit(self.acquire_one, name, url): name for name, url in todo}
+            for i, future in enumerate(as_completed(futures), 1):
+                name = futures[future]
+                try:
+                    status, entry = future.result()
+                except Exception as e:
+                    status, entry = "failed", {"error": str(e)}
+                counts[status] += 1
+                self.checkpoint[name] = dict(entry, status=status)
+                print(f"{status.upper()}: [{name}] ({i}/{len(todo)})")
+                if time.perf_counter() - saved > self.SAVE_INTERVAL:
+                    self.save()
+                    saved = time.perf_counter()
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            self.save()
+        counts["seconds"] = round(time.perf_counter() - start, 2)
+        print(f"fetched {counts['done']}/{len(todo)} fish images in {counts['seconds']}s "
+              f"({counts['missing']} without a photo, {counts['failed']} to retry, {counts['skipped']} skipped)")
+        return counts
+
+class StandInWiki(threading.Thread):
+    """Local HTTP stand-in for the wiki pages and image server.
+
+    Pages are served at /wiki/<Name> with a png logo and then a thumbnail
+    link laid out like the real site, and images at /upload/... on a second
+    host name (localhost instead of 127.0.0.1), so the acquirer's per-host
+    limits apply as they would to the two real hosts. Every request waits
+    `latency` seconds, a fraction of them (and the first `fail_first` to each
+    path) answer 503, and a fraction of the pages have no photo at all. The peak number of requests in flight is
+    recorded to check the acquirer stays within its worker count.
+    """
+
+    def __init__(self, latency=0.05, error_rate=0.0, missing_rate=0.0, fail_first=0, image_bytes=200_000,
+                 seed=None):
+        super(StandInWiki, self).__init__()
+        self.daemon = True
+        self.latency = latency
+        self.error_rate = error_rate
+        self.missing_rate = missing_rate
+        self.fail_first = fail_first
+        self.seen = {}
+        self.rng = random.Random(seed)
+        self.image = self.rng.randbytes(image_bytes)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.stats = {"requests": 0, "errors": 0, "peak_in_flight": 0}
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler())
+        self.server.daemon_threads = True
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def page_url(self, name):
+        return f"http://127.0.0.1:{self.port}/wiki/{name.replace(' ', '_')}"
+
+    # same pages every run for a given name
+    def has_photo(self, title):
+        return int(hashlib.sha1(title.encode()).hexdigest()[:8], 16) / 0xffffffff >= self.missing_rate
+
+    def page(self, title):
+        digest = hashlib.md5(title.encode()).hexdigest()
+        photo = ""
+        if self.has_photo(title):
+            photo = (f'<a href="/wiki/File:{title}.jpg" class="mw-file-description">'
+                     f'<img src="//localhost:{self.port}/upload/thumb/{digest[0]}/{digest[:2]}/{title}.jpg/'
+                     f'250px-{title}.jpg" width="250"></a>')
+        return (f'<html><body><a href="/" class="mw-file-description"><img src="/static/logo.png"></a>'
+                f'<h1>{title.replace("_", " ")}</h1><table class="infobox">{photo}</table></body></html>').encode()
+
+    def handler(self):
+        wiki = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            # clients closing pooled connections aren't errors
+            def handle(self):
+                try:
+                    super().handle()
+                except ConnectionError:
+                    pass
+
+            def do_GET(self):
+                with wiki.lock:
+                    wiki.in_flight += 1
+                    wiki.stats["requests"] += 1
+                    wiki.stats["peak_in_flight"] = max(wiki.stats["peak_in_flight"], wiki.in_flight)
+                    path = unquote(urlsplit(self.path).path)
+                    wiki.seen[path] = wiki.seen.get(path, 0) + 1
+                    failing = wiki.seen[path] <= wiki.fail_first or wiki.rng.random() < wiki.error_rate
+                try:
+                    time.sleep(wiki.latency)
+                    if failing:
+                        with wiki.lock:
+                            wiki.stats["errors"] += 1
+                        self.reply(503, b"busy", "text/plain", {"Retry-After": "0"})
+                    elif path.startswith("/wiki/"):
+                        self.reply(200, wiki.page(path[len("/wiki/"):]), "text/html; charset=utf-8")
+                    elif path.startswith("/upload/") and path.endswith(ORIGINAL_EXTS) and "/thumb/" not in path:
+                        self.reply(200, wiki.image, "image/jpeg")
+                    else:
+                        self.reply(404, b"not found", "text/plain")
+                finally:
+                    with wiki.lock:
+                        wiki.in_flight -= 1
+
+            def reply(self, status, body, content_type, headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def run(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+# one worker against many, then a rerun that should find nothing to do
+def benchmark(count=200, workers=8, rate=50, latency=0.05, error_rate=0.05, missing_rate=0.05):
+    wiki = StandInWiki(latency=latency, error_rate=error_rate, missing_rate=missing_rate, seed=0)
+    wiki.start()
+    fish = [(f"Bench fish {i}", wiki.page_url(f"Bench fish {i}")) for i in range(count)]
+    results = {"fish": count, "workers": workers, "rate_per_host": rate, "latency_s": latency,
+               "error_rate": error_rate, "missing_rate": missing_rate}
+    tmp = tempfile.mkdtemp()
+    try:
+        for label, pool_size in (("serial", 1), ("concurrent", workers)):
+            run_dir = os.path.join(tmp, label)
+            wiki.stats.update(requests=0, errors=0, peak_in_flight=0)
+            acquirer = FishAcquirer(os.path.join(run_dir, "raw"), os.path.join(run_dir, "acquire.json"),
+                                    workers=pool_size, rate=rate, retry_delay=0.05)
+            counts = acquirer.run(fish)
+            results[label] = dict(counts, fish_per_s=round(len(fish) / counts["seconds"], 1), **wiki.stats)
+
+        # the checkpoint and the raw files make a rerun a no-op
+        acquirer = FishAcquirer(os.path.join(run_dir, "raw"), os.path.join(run_dir, "acquire.json"),
+                                workers=workers, rate=rate, retry_delay=0.05)
+        results["rerun"] = acquirer.run(fish)
+    finally:
+        wiki.stop()
+        shutil.rmtree(tmp, ignore_errors=True)
+    results["speedup"] = round(results["concurrent"]["fish_per_s"] / results["serial"]["fish_per_s"], 1)
+    print(json.dumps(results, indent=2))
+    return results
+
+# every fish in the database, through the acquirer, optionally rendered into cards after
+def fetch(args):
+    app = Flask("fishAcquire")
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database_url
+    db.init_app(app)
+    with app.app_context():
+        fish = [tuple(row) for row in fishBowl.links()]
+    acquirer = FishAcquirer(args.raw_dir, args.checkpoint, workers=args.workers, rate=args.rate,
+                            retry_missing=args.retry_missing)
+    counts = acquirer.run(fish)
+    if args.render:
+        import fishCards
+        fishCards.render_all(raw_dir=args.raw_dir)
+    return counts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download the wiki photo of every fish for fishCards.py")
+    parser.add_argument("command", choices=["fetch", "bench"])
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--raw-dir", default=RAW_DIR)
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--rate", type=float, help="requests per second to each host (default 5, 50 for bench)")
+    parser.add_argument("--retry-missing", action="store_true", help="look again at pages that had no photo")
+    parser.add_argument("--render", action="store_true", help="render cards for the new images after fetching")
+    parser.add_argument("--count", type=int, default=200, help="stand-in fish for bench")
+    parser.add_argument("--latency", type=float, default=0.05, help="stand-in seconds per request for bench")
+    args = parser.parse_args()
+    if args.command == "fetch":
+        args.rate = args.rate or 5
+        fetch(args)
+    else:
+        benchmark(args.count, args.workers, args.rate or 50, args.latency)
@@ -0,0 +1,229 @@
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageDraw, ImageFont
+import numpy as np
+import argparse
+import tempfile
+import hashlib
+import shutil
+import zlib
+import time
+import os
+
+CARD_SIZE = 500
+BORDER = 5
+BORDER_COLOR = (35, 35, 35)
+BANNER_HEIGHT = 30
+CELL = 4
+SOURCE_EXTS = (".jpg", ".jpeg", ".png", ".webp", ".gif")
+
+# sizes served for responsive images, the largest is the full card
+VARIANT_WIDTHS = (125, 250, CARD_SIZE)
+VARIANT_OPTIONS = {
+    "avif": {"quality": 60},
+    "webp": {"quality": 80, "method": 6},
+    "png": {"optimize": True}}
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FISH_DIR = os.path.join(BASE_DIR, 'static', 'fish')
+RAW_DIR = os.path.join(FISH_DIR, 'raw')
+CARD_DIR = os.path.join(FISH_DIR, 'private')
+VARIANT_DIR = os.path.join(FISH_DIR, 'variants')
+FONT_PATH = os.path.join(BASE_DIR, 'static', 'fish_img', 'Consolas.ttf')
+
+def load_font(size=24):
+    try:
+        return ImageFont.truetype(FONT_PATH, size)
+    except OSError:
+        return ImageFont.load_default()
+
+# running averages along the long side of the image, one every 50px,
+# axis is the pixel axis that gets summed away (0 for rows, 1 for columns)
+def background_palette(pixels, axis):
+    along = pixels.sum(axis=axis, dtype=np.float64)
+    counts = np.arange(1, along.shape[0] + 1)[:, None] * pixels.shape[axis]
+    running = along.cumsum(axis=0) / counts
+    return running[::50].astype(np.uint8)
+
+# 3x3 blocks of palette colors on a 4px grid, black in the gaps
+def background_pattern(palette, rng):
+    cells = CARD_SIZE // CELL + 1
+    picks = palette[rng.integers(0, len(palette), size=(cells, cells))]
+    pattern = np.repeat(np.repeat(picks, CELL, axis=0), CELL, axis=1)[:CARD_SIZE, :CARD_SIZE]
+    gap = (np.arange(CARD_SIZE) % CELL) == CELL - 1
+    pattern[gap, :] = 0
+    pattern[:, gap] = 0
+    return pattern
+
+# builds the 500x500 display card for one source image
+def make_card(source, name, font=None):
+    if isinstance(source, Image.Image):
+        image = source.convert("RGB")
+    else:
+        with Image.open(source) as opened:
+            image = opened.convert("RGB")
+    factor = CARD_SIZE / max(image.size)
+    scaled = image.resize((max(1, int(image.size[0] * factor)), max(1, int(image.size[1] * factor))),
+                          Image.LANCZOS)
+    pixels = np.asarray(scaled)
+
+    # pad along the shorter side, centred
+    side = 1 if scaled.size[0] >= scaled.size[1] else 0
+    length = scaled.size[side]
+    offset = (CARD_SIZE - length) // 2
+
+    # patterned background, only outside the photo
+    rng = np.random.default_rng(zlib.crc32(name.encode()))
+    card = background_pattern(background_palette(pixels, 1 - side), rng)
+    if side == 0:
+        card[:pixels.shape[0], offset:offset + pixels.shape[1]] = pixels
+    else:
+        card[offset:offset + pixels.shape[0], :pixels.shape[1]] = pixels
+
+    # border
+    card[:BORDER, :] = BORDER_COLOR
+    card[-BORDER:, :] = BORDER_COLOR
+    card[:, :BORDER] = BORDER_COLOR
+    card[:, -BORDER:] = BORDER_COLOR
+
+    # name banner
+    final = Image.fromarray(card)
+    draw = ImageDraw.Draw(final)
+    draw.rectangle(((0, 0), (CARD_SIZE, BANNER_HEIGHT)), fill="black")
+    draw.text((15, 5), name + ":", (255, 255, 255), font=font if font else load_font())
+    return final
+
+# formats this Pillow build can write, best first, avif needs a plugin
+def variant_formats():
+    Image.init()
+    return [fmt for fmt in VARIANT_OPTIONS if fmt.upper() in Image.SAVE]
+
+# writes any missing size/format variants of a card, returns
+# {width: {format: path relative to the fish dir}}
+def make_variants(card_path, name, variant_dir=VARIANT_DIR, fish_dir=FISH_DIR):
+    out_dir = os.path.join(variant_dir, name)
+    os.makedirs(out_dir, exist_ok=True)
+    variants = {}
+    card = None
+    for width in VARIANT_WIDTHS:
+        variants[str(width)] = {}
+        for fmt in variant_formats():
+            if width == CARD_SIZE and fmt == "png":
+                path = card_path
+            else:
+                path = os.path.join(out_dir, f"{width}.{fmt}")
+                if not os.path.isfile(path):
+                    if card is None:
+                        with Image.open(card_path) as opened:
+                            card = opened.convert("RGB")
+                    resized = card if width == CARD_SIZE else card.resize((width, width), Image.LANCZOS)
+                    resized.save(path, **VARIANT_OPTIONS[fmt])
+            variants[str(width)][fmt] = os.path.relpath(path, fish_dir)
+    return variants
+
+# packs cards into one grid image per scale, saved under out_dir with a
+# content hash in the name, returns the offset map for the page
+def make_atlas(cards, out_dir, tile=250, cols=4, scales=(1, 2)):
+    if not cards:
+        return None
+    rows = -(-len(cards) // cols)
+    atlas = {"cols": cols, "rows": rows, "tile": tile, "fish": {}, "files": {}}
+    sheets = {}
+    for scale in scales:
+        size = tile * scale
+        sheet = Image.new("RGB", (cols * size, rows * size))
+        for i, (name, card_path) in enumerate(cards):
+            with Image.open(card_path) as opened:
+                sheet.paste(opened.convert("RGB").resize((size, size), Image.LANCZOS),
+                            ((i % cols) * size, (i // cols) * size))
+            atlas["fish"][name] = [i % cols, i // cols]
+        sheets[scale] = sheet
+    atlas["hash"] = hashlib.sha1(sheets[scales[0]].tobytes()).hexdigest()[:16]
+    for scale, sheet in sheets.items():
+        atlas["files"][str(scale)] = {}
+        for fmt in variant_formats():
+            path = os.path.join(out_dir, f"atlas-{atlas['hash']}-{scale}x.{fmt}")
+            sheet.save(path, **VARIANT_OPTIONS[fmt])
+            atlas["files"][str(scale)][fmt] = path
+    return atlas
+
+def render_one(job):
+    source, destination, name, variant_dir = job
+    try:
+        make_card(source, name).save(destination)
+        shutil.rmtree(os.path.join(variant_dir, name), ignore_errors=True)
+        make_variants(destination, name, variant_dir, os.path.dirname(variant_dir))
+        return name, True
+    except Exception as e:
+        print(f"FAILED [{name}]: {e}")
+        return name, False
+
+# (source, card path, fish name, variant dir) for every raw image without a card yet
+def pending_jobs(raw_dir=RAW_DIR, card_dir=CARD_DIR, variant_dir=VARIANT_DIR, force=False):
+    jobs = []
+    for filename in sorted(os.listdir(raw_dir)):
+        name, ext = os.path.splitext(filename)
+        if ext.lower() not in SOURCE_EXTS:
+            continue
+        destination = os.path.join(card_dir, name + ".png")
+        if force or not os.path.isfile(destination):
+            jobs.append((os.path.join(raw_dir, filename), destination, name, variant_dir))
+    return jobs
+
+# render cards for the whole catalog across a process pool
+def render_all(raw_dir=RAW_DIR, card_dir=CARD_DIR, variant_dir=VARIANT_DIR, workers=None, force=False):
+    os.makedirs(card_dir, exist_ok=True)
+    jobs = pending_jobs(raw_dir, card_dir, variant_dir, force)
+    if not jobs:
+        print("all fish cards are up to date")
+        return 0
+    done = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for name, ok in pool.map(render_one, jobs, chunksize=4):
+            done += ok
+            print(f"DONE: [{name}] ({done}/{len(jobs)})" if ok else f"FAILED: [{name}]")
+    elapsed = time.perf_counter() - start
+    print(f"rendered {done}/{len(jobs)} cards in {elapsed:.1f}s ({done / elapsed:.1f} img/s)")
+    return done
+
+# images/sec for one process and for the pool, on synthetic photos
+def benchmark(count=40, workers=None):
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_dir = os.path.join(tmp, "raw")
+        os.makedirs(raw_dir)
+        for i in range(count):
+            w, h = rng.integers(300, 2000, size=2)
+            Image.fromarray(rng.integers(0, 255, size=(h, w, 3), dtype=np.uint8)).save(
+                os.path.join(raw_dir, f"Fish {i}.jpg"), quality=85)
+        jobs = pending_jobs(raw_dir, os.path.join(tmp, "cards"), os.path.join(tmp, "variants"))
+        os.makedirs(os.path.join(tmp, "cards"))
+
+        start = time.perf_counter()
+        for job in jobs:
+            render_one(job)
+        serial = count / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(render_one, jobs, chunksize=4))
+        pooled = count / (time.perf_counter() - start)
+    results = {"images": count, "serial_img_per_s": round(serial, 1), "pool_img_per_s": round(pooled, 1),
+               "workers": workers or os.cpu_count()}
+    print(results)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render fish of the week display cards")
+    parser.add_argument("command", choices=["render", "bench"])
+    parser.add_argument("--raw-dir", default=RAW_DIR)
+    parser.add_argument("--card-dir", default=CARD_DIR)
+    parser.add_argument("--variant-dir", default=VARIANT_DIR)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--force", action="store_true", help="re-render cards that already exist")
+    parser.add_argument("--count", type=int, default=40, help="synthetic images for bench")
+    args = parser.parse_args()
+    if args.command == "render":
+        render_all(args.raw_dir, args.card_dir, args.variant_dir, args.workers, args.force)
+    else:
+        benchmark(args.count, args.workers)
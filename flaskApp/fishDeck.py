@@ -0,0 +1,120 @@
+from model import FishOfTheWeek as fishBowl
+import random
+import json
+import os
+
+class FishDeck:
+    """Picks the next fish by dealing from a shuffled deck of the whole catalog.
+
+    The deck (fish ids in dealing order plus the next position) is saved with
+    the other local state in spool/ (FISH_DECK), out of the public static
+    folder, so every fish comes up once per pass through the catalog across
+    restarts. Eligibility is answered from an in-memory index:
+    the cooldown dates from one column-only query and the rendered cards from
+    one directory listing, both reloaded only when the catalog or the card
+    folder changes. A card that is still cooling down is swapped with an
+    eligible one a little further on, a fish without a card is skipped until
+    the next pass, and new fish are shuffled into the part of the deck not
+    dealt yet.
+    """
+
+    def __init__(self, private_dir, deck_path, rng=None):
+        self.private_dir = private_dir
+        self.deck_path = deck_path
+        self.rng = rng if rng else random.SystemRandom()
+        self.order = []
+        self.position = 0
+        self.names = {}
+        self.last_chosen = {}
+        self.cards = set()
+        self.catalog_signature = None
+        self.cards_mtime = None
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.deck_path) as f:
+                deck = json.load(f)
+            self.order = deck["order"]
+            self.position = deck["position"]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"starting a new fish deck: {e}")
+
+    # write the deck beside itself and rename it over, so a crash never leaves half a file
+    def save(self):
+        tmp_path = self.deck_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"order": self.order, "position": self.position}, f)
+        os.replace(tmp_path, self.deck_path)
+
+    # reload the parts of the index that changed, needs an app context
+    def refresh(self):
+        signature = fishBowl.catalog_signature()
+        if signature != self.catalog_signature:
+            self.catalog_signature = signature
+            self.names = {}
+            self.last_chosen = {}
+            for fish_id, name, last_chosen_week in fishBowl.catalog():
+                self.names[fish_id] = name
+                self.last_chosen[fish_id] = last_chosen_week
+            self.add_new_fish()
+        try:
+            mtime = os.stat(self.private_dir).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime != self.cards_mtime:
+            self.cards_mtime = mtime
+            self.cards = set(os.listdir(self.private_dir)) if mtime else set()
+
+    # shuffle fish the deck hasn't seen into the cards still to be dealt
+    def add_new_fish(self):
+        dealt = set(self.order)
+        for fish_id in self.names:
+            if fish_id not in dealt:
+                self.order.append(fish_id)
+                swap = self.rng.randint(self.position, len(self.order) - 1)
+                self.order[swap], self.order[-1] = self.order[-1], self.order[swap]
+
+    def reshuffle(self):
+        self.order = list(self.names)
+        self.rng.shuffle(self.order)
+        self.position = 0
+
+    def has_card(self, fish_id):
+        return self.names[fish_id] + ".png" in self.cards
+
+    def cooled_down(self, fish_id, cutoff):
+        last = self.last_chosen[fish_id]
+        return last is None or last < cutoff
+
+    # next eligible fish id, or None when no fish is eligible at all
+    def draw(self, today=None):
+        self.refresh()
+        cutoff = fishBowl.cooldown_cutoff(today)
+        reshuffled = False
+        while True:
+            if self.position >= len(self.order):
+                if reshuffled or not self.names:
+                    return None
+                self.reshuffle()
+                reshuffled = True
+            fish_id = self.order[self.position]
+            if fish_id not in self.names or not self.has_card(fish_id):
+                self.position += 1
+                continue
+            if not self.cooled_down(fish_id, cutoff):
+                later = [i for i in range(self.position + 1, min(len(self.order), self.position + 64))
+                         if self.order[i] in self.names and self.cooled_down(self.order[i], cutoff)]
+                if not later:
+                    self.position += 1
+                    continue
+                swap = self.rng.choice(later)
+                self.order[self.position], self.order[swap] = self.order[swap], self.order[self.position]
+                continue
+            self.position += 1
+            self.save()
+            return fish_id
+
+    # record a pick so the index doesn't need a reload to see the cooldown
+    def chosen(self, fish_id, week):
+        self.last_chosen[fish_id] = week
@@ -0,0 +1,118 @@
+from model import FishOfTheWeek as fishBowl, db
+from collections import defaultdict
+from bisect import bisect_left
+import unicodedata
+import threading
+import heapq
+import time
+import re
+
+# casefolded words without accents or punctuation
+def normalize(text):
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text)
+        text = "".join(c for c in text if not unicodedata.combining(c))
+    text = text.casefold()
+    return " ".join(re.sub(r"[\W_]+", " ", text).split())
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class FishIndex:
+    """One immutable build of the search index, swapped in whole"""
+
+    def __init__(self, rows):
+        rows = sorted((normalize(name), fish_id, name, url, week) for fish_id, name, url, week in rows)
+        self.fish = [{"name": name, "wiki_url": url, "date": week} for _, _, name, url, week in rows]
+        self.names = [row[0] for row in rows]
+
+        # every word of every name for prefix lookups, positions per trigram for substrings
+        self.words = sorted((word, i) for i, name in enumerate(self.names) for word in set(name.split()))
+        postings = defaultdict(list)
+        for i, name in enumerate(self.names):
+            for gram in trigrams(name):
+                postings[gram].append(i)
+        self.trigrams = dict(postings)
+
+    # positions whose name has a word starting with prefix
+    def prefixed(self, prefix):
+        found = set()
+        i = bisect_left(self.words, (prefix,))
+        while i < len(self.words) and self.words[i][0].startswith(prefix):
+            found.add(self.words[i][1])
+            i += 1
+        return found
+
+    # positions whose name contains query, narrowed by the rarest trigrams first
+    def containing(self, query):
+        lists = sorted((self.trigrams.get(gram, ()) for gram in trigrams(query)), key=len)
+        if not lists or not lists[0]:
+            return set()
+        found = set(lists[0])
+        for positions in lists[1:]:
+            found.intersection_update(positions)
+            if not found:
+                return found
+        return {i for i in found if query in self.names[i]}
+
+    def search(self, query, limit):
+        query = normalize(query)
+        if not query:
+            return [], 0
+        found = self.containing(query) if len(query) >= 3 else self.prefixed(query)
+        if not found:
+            return [], 0
+
+        # names starting with the query are one run of the sorted names, the whole name first
+        lo = bisect_left(self.names, query)
+        hi = bisect_left(self.names, query[:-1] + chr(ord(query[-1]) + 1))
+        best = list(range(lo, min(hi, lo + limit)))
+
+        # then names with a later word starting with it, then the rest, alphabetical within each
+        if len(best) < limit:
+            words = self.prefixed(query) if len(query) >= 3 else found
+            best += heapq.nsmallest(limit - len(best), (i for i in words if not lo <= i < hi))
+            if len(best) < limit:
+                best += heapq.nsmallest(limit - len(best), (i for i in found if not lo <= i < hi and i not in words))
+        return [self.fish[i] for i in best], len(found)
+
+class FishSearch:
+    """Prefix and substring search over the fish catalog, answered from memory.
+
+    The catalog is loaded once into a word list for prefix lookups and a
+    trigram index for substrings, so a search touches only the names sharing
+    the query's rarest trigrams. The index is rebuilt when a new fish is
+    chosen, and when the catalog's row count or max id moves, checked at most
+    once per CHECK_INTERVAL.
+    """
+
+    CHECK_INTERVAL = 60
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.index = None
+        self.generation = None
+        self.signature = None
+        self.next_check = 0
+
+    def refresh(self):
+        generation = fishBowl.generation()
+        if self.index is not None and generation == self.generation and time.monotonic() < self.next_check:
+            return self.index
+        with self.lock:
+            if self.index is None or generation != self.generation or time.monotonic() >= self.next_check:
+                signature = fishBowl.catalog_signature()
+                if self.index is None or generation != self.generation or signature != self.signature:
+                    start = time.perf_counter()
+                    rows = db.session.execute(db.select(
+                        fishBowl.id, fishBowl.fish_name, fishBowl.wiki_url, fishBowl.last_chosen_week)).all()
+                    self.index = FishIndex(rows)
+                    print(f"fish search index: {len(rows)} fish in {(time.perf_counter() - start) * 1000:.1f} ms")
+                self.generation = generation
+                self.signature = signature
+                self.next_check = time.monotonic() + self.CHECK_INTERVAL
+        return self.index
+
+    # (matching fish, best first, and the total number of matches)
+    def search(self, query, limit=20):
+        return self.refresh().search(query, limit)
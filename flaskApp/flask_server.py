@@ -1,20 +1,32 @@
-from flask import Flask, request, session, render_template, redirect, url_for, jsonify, abort, send_from_directory
+from flask import Flask, Response, request, session, render_template, redirect, url_for, jsonify, abort
 from werkzeug.security import check_password_hash
 from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_sqlalchemy import SQLAlchemy
 from flask_wtf.csrf import CSRFProtect
-from sqlalchemy import select, update
+from sqlalchemy import select, update, text
 from flask import app as application
-from datetime import timedelta
+from datetime import timedelta, date
 from dotenv import load_dotenv
 from threading import Thread
+import binascii
+import base64
 import json
-import pytz
 import os
 
-from model import User, Arduino, FishOfTheWeek, TemperatureData, RGBLightValue, CurrentTemperature, db 
+from deviceManager import DeviceManager
+from eventStream import EventStream
+from responseCache import ResponseCache
+from temperatureChart import TemperatureChart
+from temperatureExport import TemperatureExport, parse_time
+from stateSync import StateSync
+from fishOfTheWeek import PublicFish
+from fishSearch import FishSearch
+from staticAssets import StaticAssets
+from readiness import READINESS, Warmup
+import metrics
+from model import User, Arduino, FishOfTheWeek, RGBLightValue, db 
 
 # pull info from .env
 load_dotenv()
@@ -35,9 +47,28 @@ app.config['CACHE_TYPE'] = 'simple'
 app.config['CACHE_DEFAULT_TIMEOUT'] = 604800 
 
 db.init_app(app)
+metrics.init_app(app)
 csrf = CSRFProtect(app)
-with app.app_context():
-    Arduino.initialize_cache()
+
+events = EventStream()
+fish_cache = ResponseCache()
+fish_search = FishSearch()
+charts = TemperatureChart(app)
+state_sync = StateSync(app)
+public_fish = PublicFish(os.path.join(app.static_folder, 'fish'))
+assets = StaticAssets(os.path.join(app.static_folder, 'dist'))
+# nothing touches the database at import, the caches are filled in the background
+warmup = Warmup(app)
+warmup.add("database", lambda: db.session.execute(text("SELECT 1")))
+warmup.add("arduino", Arduino.refresh_cache)
+warmup.add("zones", RGBLightValue.load_zones)
+warmup.add("charts", charts.rebuild)
+warmup.add("fish", public_fish.refresh)
+warmup.add("fish_search", fish_search.refresh)
+warmup.add("assets", assets.load)
+metrics.REGISTRY.add(metrics.Gauge(
+    "awsite_response_cache", "Fish response cache counters of this process",
+    lambda: {(name,): value for name, value in fish_cache.stats().items() if name != "generation"}, ("stat",)))
 
 limiter = Limiter(
     app=app,
@@ -46,6 +77,69 @@ limiter = Limiter(
     storage_uri="memory://"
 )
 
+# dashboard color buttons: (name, rgb, text color)
+LIGHT_SWATCHES = [
+    ("purple", (55, 0, 200), "#8344b3"),
+    ("red", (255, 0, 0), "#b72525"),
+    ("green", (0, 255, 0), "#34a834"),
+    ("blue", (0, 0, 255), "#3c3cc4"),
+    ("off", (0, 0, 0), None)]
+
+# presets cycle through their colors across the zones in name order
+LIGHT_PRESETS = {
+    "all-on": [(255, 0, 0), (55, 0, 200)],
+    "all-off": [(0, 0, 0)]}
+
+def preset_colors(preset):
+    if not isinstance(preset, str) or preset not in LIGHT_PRESETS:
+        raise ValueError(f"unknown preset {preset}")
+    colors = LIGHT_PRESETS[preset]
+    return {zone: colors[i % len(colors)] for i, zone in enumerate(RGBLightValue.get_zones())}
+
+# swatch name for each zone's current color, "none" for custom colors
+def selected_swatches():
+    names = {rgb: name for name, rgb, _ in LIGHT_SWATCHES}
+    return {zone: names.get(rgb, "none") for zone, rgb in RGBLightValue.get_zones().items()}
+
+# store the new colors, then have the connected boards driving them pick them up
+def apply_lights(changes):
+    RGBLightValue.set_colors(changes)
+    for device_id in Arduino.devices_for_zones(changes):
+        if Arduino.get_state(device_id) != "offline":
+            Arduino.update_state("update", device_id, commit=False)
+    Arduino.request_colors(zones=changes)
+
+# each worker listens for cache changes made by the others, started with the
+# worker by gunicorn.conf.py, this covers servers that don't
+@app.before_request
+def start_state_sync():
+    warmup.ensure_started()
+    state_sync.ensure_started()
+
+# liveness, answered without touching the database
+@app.route('/healthz', methods=['GET'])
+@limiter.exempt
+def healthz():
+    return jsonify({"status": "ok"}), 200
+
+# readiness, 503 until every required subsystem of this worker is warm
+@app.route('/readyz', methods=['GET'])
+@limiter.exempt
+def readyz():
+    report = READINESS.report()
+    return jsonify(report), 200 if report["ready"] else 503
+
+# hashed asset urls for the templates
+@app.context_processor
+def asset_helpers():
+    return {'asset_url': assets.url}
+
+# built css/js, precompressed and cached forever
+@app.route('/assets/<path:filename>')
+@limiter.exempt
+def serve_asset(filename):
+    return assets.send(filename)
+
 # deliver main html page
 @app.route('/', methods=['GET'])
 def main_page():
@@ -62,7 +156,6 @@ def auth_page():
     pw = request.form.get("Password").strip()
     if not un or not pw or len(un) > 100 or len(pw) > 100:
         return json.dumps({"error": "Invalid credentials"}), 401
-    print(request.form)
     user = User.query.filter_by(username=un).first()
 
     if not user or not check_password_hash(user.password_hash, pw):
@@ -90,32 +183,19 @@ def dashboard():
             except json.JSONDecodeError as e:
                 print(f"json-error: {e}")
                 return "Invalid JSON format", 400
-            print(light_data)
-
-            # update the db with new colors
-            if light_data['zone'] == "all-on":
-                RGBLightValue.get_by_name("zone1").update_color(255, 0, 0)
-                RGBLightValue.get_by_name("zone2").update_color(55, 0, 200)
-            elif light_data['zone'] == "all-off":
-                RGBLightValue.get_by_name("zone1").update_color(0, 0, 0)
-                RGBLightValue.get_by_name("zone2").update_color(0, 0, 0)
-            else:
-                RGBLightValue.get_by_name(light_data['zone']).update_color(light_data['r'], light_data['g'], light_data['b'])
-            Arduino.update_state("update")
-
-    # get selected colors from the db
-    colors = {}
-    zones = ["zone1", "zone2"]
-    rgb_button_map = {(0, 0, 0): "off", (255, 0, 0): "red", (0, 255, 0): "green", (0, 0, 255): "blue", (55, 0, 200): "purple"}
-    for z in zones:
-        rgb =  RGBLightValue.get_by_name(z).rgb_tuple
-        if rgb in rgb_button_map:
-            colors[z] = rgb_button_map[rgb]
-        else:
-            colors[z] = "none"
-    print(colors)
-
-    return render_template("dashboard.html", colorData=colors)
+            if not isinstance(light_data, dict):
+                return jsonify({"error": "expected a JSON object"}), 400
+
+            try:
+                if light_data['zone'] in LIGHT_PRESETS:
+                    apply_lights(preset_colors(light_data['zone']))
+                else:
+                    apply_lights({light_data['zone']: [light_data['r'], light_data['g'], light_data['b']]})
+            except (KeyError, TypeError, ValueError) as e:
+                return f"Invalid light change: {e}", 400
+
+    return render_template("dashboard.html", colorData=selected_swatches(),
+                           zones=list(RGBLightValue.get_zones()), swatches=LIGHT_SWATCHES)
 
 # logout a user
 @app.route('/logout', methods=['POST'])
@@ -131,59 +211,185 @@ def arduino():
         return json.dumps({"error": "Invalid credentials"}), 401
     ard_out = {
         "status": Arduino.get_state(),
-        "port": Arduino.get_port()}
+        "port": Arduino.get_port(),
+        "devices": [{key: device[key] for key in ("name", "port", "state", "zones", "sensor")}
+                    for device in Arduino.get_devices()],
+        "latency_ms": DeviceManager.latency_stats()}
     return json.dumps(ard_out), 200
    
-# gets temperature data from the db
+# current zone colors, or a batch of zone changes applied together
+@app.route('/api/lights', methods=['GET', 'POST'])
+@limiter.limit("30 per minute")
+def lights():
+    if 'user_id' not in session:
+        return jsonify({"error": "Invalid credentials"}), 401
+    if request.method == 'POST':
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({"error": "expected a JSON object"}), 400
+        try:
+            changes = preset_colors(data["preset"]) if "preset" in data else data.get("zones", {})
+            if not isinstance(changes, dict) or not changes:
+                raise ValueError("no zone changes given")
+            apply_lights(changes)
+        except (KeyError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+    return jsonify({"zones": RGBLightValue.get_zones(), "selected": selected_swatches(),
+                    "status": Arduino.get_state()}), 200
+
+# pushes arduino status and new temperature readings to the dashboard
+@app.route('/api/stream', methods=['GET'])
+@limiter.limit("10 per minute")
+def stream():
+    if 'user_id' not in session:
+        return json.dumps({"error": "Invalid credentials"}), 401
+    status = {"status": Arduino.get_state(), "port": Arduino.get_port()}
+    first = f"event: status\ndata: {json.dumps(status)}\n\n".encode()
+    return Response(events.stream(first), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# gets temperature data, pre-encoded whenever new readings are written
 @app.route('/api/temperature', methods=['POST'])
 @limiter.limit("30 per minute")
 def temperature():
     if 'user_id' not in session:
         return json.dumps({"error": "Invalid credentials"}), 401
-    
-    db_data = TemperatureData.get_all()
-    est = pytz.timezone('America/New_York')
-    chart_data = None
-    if db_data and (len(db_data) > 0):
-        chart_data = {
-            'cols': [
-                {'label': 'Time', 'type': 'string'},
-                {'label': 'Temperature (°F)', 'type': 'number'}],
-            'rows': [
-                {'c': [{'v': t.timestamp.replace(tzinfo=pytz.utc).astimezone(est).strftime('%I:%M %p')},
-                       {'v': float(int((((t.avg_temp*(9/5))+32))*10))/10}]} for t in reversed(db_data)]}
-        
-    ct_val = CurrentTemperature.get_current()
-    ct_out = None
-    if ct_val:
-        ct_out = round((ct_val.current_temp * (9/5) + 32), 1)
-
-    out = {"chartData": chart_data, "ct": ct_out}
-    return jsonify(out), 200
-
-# gets current fish from the db
+    payload = charts.get(request.args.get("range", "24h"))
+    if payload is None:
+        return json.dumps({"error": "Invalid range"}), 400
+    return Response(payload, mimetype="application/json")
+
+# streams a temperature tier between ?start= and ?end= (ISO 8601, UTC by default) as csv or ndjson
+@app.route('/api/export', methods=['GET'])
+@limiter.limit("10 per minute")
+def export_temperature():
+    if 'user_id' not in session:
+        return json.dumps({"error": "Invalid credentials"}), 401
+    try:
+        export = TemperatureExport(db.engine, request.args.get("tier", "hourly"), request.args.get("format", "csv"),
+                                   parse_time(request.args.get("start")), parse_time(request.args.get("end")))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return Response(export.stream(), mimetype=export.mimetype, headers={
+        "Content-Disposition": f"attachment; filename={export.filename}",
+        "Cache-Control": "no-store",
+        "X-Accel-Buffering": "no"})
+
+# gets current fish from the db, cached until a new fish is chosen
 @app.route('/api/fish', methods=['GET'])
 @limiter.limit("60 per minute")
 def get_current_fish():
-    fish_list = FishOfTheWeek.get_fish()
-    out = [{
-            'name': fish.fish_name,
-            'wiki_url': fish.wiki_url,
-            'date': fish.last_chosen_week}
-        for fish in fish_list]
-    return jsonify({'fish': out}), 200
-
-# serve public fish images
+    def build():
+        fish_list = FishOfTheWeek.get_fish()
+        out = [{
+                'name': fish.fish_name,
+                'wiki_url': fish.wiki_url,
+                'date': fish.last_chosen_week}
+            for fish in fish_list]
+        return app.json.dumps({'fish': out, 'atlas': public_fish.atlas_map()}).encode()
+    body, etag = fish_cache.get("api/fish", FishOfTheWeek.generation(), build)
+    return fish_cache.respond(body, etag, "application/json", "no-cache")
+
+# opaque history cursor for the (week, id) key of the last fish on a page
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(f"{key[0].isoformat()}:{key[1]}".encode()).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    try:
+        week, fish_id = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().split(":")
+        return date.fromisoformat(week), int(fish_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("invalid cursor")
+
+# older weeks a page at a time, ?cursor= from the previous page's "next"
+@app.route('/api/fish/history', methods=['GET'])
+@limiter.limit("60 per minute")
+def fish_history():
+    cursor = request.args.get("cursor")
+    limit = min(max(request.args.get("limit", 12, type=int), 1), 50)
+    try:
+        before = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def build():
+        fish_list, next_key = FishOfTheWeek.history(before, limit)
+        out = [{
+                'name': fish.fish_name,
+                'wiki_url': fish.wiki_url,
+                'date': fish.last_chosen_week}
+            for fish in fish_list]
+        return app.json.dumps({'fish': out, 'next': encode_cursor(next_key) if next_key else None}).encode()
+
+    # only first pages are cached, a cursor can name any (week, id) and would grow the cache without bound
+    key = f"api/fish/history/{limit}" if before is None else None
+    body, etag = fish_cache.get(key, FishOfTheWeek.generation(), build)
+    return fish_cache.respond(body, etag, "application/json", "no-cache")
+
+# catalog search by word prefix, or by substring from three characters on
+@app.route('/api/fish/search', methods=['GET'])
+@limiter.limit("60 per minute")
+def fish_catalog_search():
+    query = request.args.get("q", "")
+    if len(query) > 100:
+        return jsonify({"error": "query too long"}), 400
+    limit = min(max(request.args.get("limit", 20, type=int), 1), 50)
+    results, total = fish_search.search(query, limit)
+    return Response(app.json.dumps({'query': query, 'fish': results, 'total': total}), mimetype="application/json")
+
+def accepted_image_formats():
+    accept = request.headers.get('Accept', '')
+    return [fmt for fmt in ("avif", "webp") if f"image/{fmt}" in accept] + ["png"]
+
+def read_file(file_path):
+    try:
+        with open(file_path, 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+# serve public fish images, resized with ?w= and in the best format the client accepts
 @app.route('/fish/<filename>')
 @limiter.limit("100 per minute")
 def serve_public_fish(filename):
-    public_dir = os.path.join(app.static_folder, 'fish', 'public')
-    if not filename or '/' in filename or '\\' in filename or '..' in filename:
+    width = request.args.get('w', type=int)
+    fmt, file_path = public_fish.variant(filename, width, accepted_image_formats())
+    if not file_path:
+        abort(404)
+
+    # keyed on the file served, a handful of variants per fish whatever ?w= clients send
+    body, etag = fish_cache.get(f"fish/{file_path}", FishOfTheWeek.generation(),
+                                lambda: read_file(file_path))
+    if body is None:
+        abort(404)
+    response = fish_cache.respond(body, etag, f"image/{fmt}", 'public, max-age=604800')
+    response.headers['Vary'] = 'Accept, Accept-Encoding'
+    return response
+
+# sprite sheet of the whole fish grid, the url changes whenever its content does
+@app.route('/fish/atlas/<atlas_hash>-<scale>x')
+@limiter.limit("100 per minute")
+def serve_fish_atlas(atlas_hash, scale):
+    fmt, file_path = public_fish.atlas_file(atlas_hash, scale, accepted_image_formats())
+    if not file_path:
         abort(404)
-    file_path = os.path.join(public_dir, filename)
-    if not os.path.exists(file_path):
-        abort(404)  
-    response = send_from_directory(public_dir, filename)
-    response.headers['Cache-Control'] = 'public, max-age=604800'
-    response.headers['Vary'] = 'Accept-Encoding'
-    return response
\ No newline at end of file
+    body, etag = fish_cache.get(f"atlas/{atlas_hash}/{scale}/{fmt}", FishOfTheWeek.generation(),
+                                lambda: read_file(file_path))
+    if body is None:
+        abort(404)
+    response = fish_cache.respond(body, etag, f"image/{fmt}", 'public, max-age=31536000, immutable')
+    response.headers['Vary'] = 'Accept'
+    return response
+
+# prometheus scrape endpoint, covering every worker sharing METRICS_DIR
+@app.route('/metrics', methods=['GET'])
+@limiter.exempt
+def metrics_page():
+    return metrics.render_response()
+
+# response cache hit/miss counters
+@app.route('/api/cache', methods=['GET'])
+def cache_stats():
+    if 'user_id' not in session:
+        return json.dumps({"error": "Invalid credentials"}), 401
+    return jsonify({"fish": fish_cache.stats()}), 200
@@ -0,0 +1,28 @@
+# production server: gunicorn -c gunicorn.conf.py wsgi:app
+import multiprocessing
+import shutil
+import os
+
+bind = "0.0.0.0:5100"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+
+# threads keep long-lived event streams from tying up a whole worker
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", "8"))
+timeout = 60
+
+# each worker writes its metrics here and /metrics on any of them sums them all,
+# emptied when the server starts so counters begin again at zero like a single process
+os.environ.setdefault("METRICS_DIR", "/tmp/awsite-metrics")
+
+def on_starting(server):
+    shutil.rmtree(os.environ["METRICS_DIR"], ignore_errors=True)
+
+# every worker warms its caches and listens for changes from the others in the
+# background and campaigns, the winner owns the arduino and the schedulers
+def post_worker_init(worker):
+    from leaderElection import LeaderElection
+    from wsgi import app, start_background, warmup, state_sync
+    warmup.ensure_started()
+    state_sync.ensure_started()
+    LeaderElection(app, start_background).start()
@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+import math
+import json
+import os
+
+class HourlyAggregator:
+    """Running count, mean, min, max and variance of the current UTC hour.
+
+    Each reading updates the totals in O(1) (Welford's method for the
+    variance), and the first reading or tick in a later hour closes the
+    previous one into a single rollup, so each wall-clock hour is emitted
+    exactly once. The partial hour is saved to a small JSON file after every
+    change, so a restart carries on where it left off instead of rescanning
+    the hour's rows. A closed hour is handed to on_rollup before the new hour
+    replaces it on disk, so a crash in between repeats the rollup rather than
+    losing it.
+    """
+
+    def __init__(self, state_path, on_rollup):
+        self.state_path = state_path
+        self.on_rollup = on_rollup
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        self.reset(None)
+        self.load()
+
+    def reset(self, hour):
+        self.hour = hour
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def load(self):
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+            self.hour = datetime.fromisoformat(state["hour"]) if state["hour"] else None
+            self.count = state["count"]
+            self.mean = state["mean"]
+            self.m2 = state["m2"]
+            self.min = state["min"]
+            self.max = state["max"]
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as e:
+            print(f"starting a new hourly aggregate: {e}")
+
+    # write beside the file and rename over it, a crash leaves the old state
+    def save(self):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"hour": self.hour.isoformat() if self.hour else None, "count": self.count,
+                       "mean": self.mean, "m2": self.m2, "min": self.min, "max": self.max}, f)
+        os.replace(tmp_path, self.state_path)
+
+    @staticmethod
+    def hour_of(now):
+        return now.replace(minute=0, second=0, microsecond=0)
+
+    # the finished hour's stats, timestamped mid-hour like the daily tier is at midday
+    def rollup(self):
+        return {
+            "timestamp": (self.hour + timedelta(minutes=30)).isoformat(),
+            "avg": round(self.mean, 1),
+            "min": self.min,
+            "max": self.max,
+            "stddev": round(math.sqrt(self.m2 / self.count), 3),
+            "count": self.count}
+
+    # close the current hour if now is past it, its rollup goes out before the reset is saved
+    def tick(self, now=None):
+        hour = self.hour_of(now if now else datetime.utcnow())
+        if self.hour is not None and hour <= self.hour:
+            return
+        if self.count:
+            self.on_rollup(self.rollup())
+        self.reset(hour)
+        self.save()
+
+    # add one reading, closing the previous hour first if this is a later one
+    def add(self, temp, now=None):
+        now = now if now else datetime.utcnow()
+        self.tick(now)
+        self.count += 1
+        delta = temp - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (temp - self.mean)
+        self.min = temp if self.min is None else min(self.min, temp)
+        self.max = temp if self.max is None else max(self.max, temp)
+        self.save()
@@ -0,0 +1,73 @@
+from model import db
+from sqlalchemy import text
+import threading
+import fcntl
+import os
+
+class LeaderElection(threading.Thread):
+    """Elects one process to own the serial port and the background schedulers.
+
+    With postgres the leader holds a session advisory lock on a dedicated
+    connection, otherwise an exclusive lock on a local file. Either lock is
+    released by the OS or the database when the leader dies, so the next
+    follower to retry takes over. A leader that loses its lock connection
+    exits so its workers can't keep running beside a new leader.
+    """
+
+    LOCK_KEY = 0x617773  # "aws"
+
+    def __init__(self, app, on_elected, retry_delay=5, lock_path=None):
+        super(LeaderElection, self).__init__()
+        self.app = app
+        self.daemon = True
+        self.on_elected = on_elected
+        self.retry_delay = retry_delay
+        self.lock_path = lock_path if lock_path else os.getenv("LEADER_LOCK", "/tmp/awsite-leader.lock")
+        self.conn = None
+        self.lock_file = None
+        self.is_leader = False
+
+    def try_postgres_lock(self):
+        if self.conn is None:
+            self.conn = db.engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+        return self.conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": self.LOCK_KEY}).scalar()
+
+    def try_file_lock(self):
+        if self.lock_file is None:
+            self.lock_file = open(self.lock_path, "a")
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    # keep the lock referenced for the life of the process, and with postgres
+    # keep checking its connection is still there since the lock dies with it
+    def hold_lock(self):
+        while True:
+            threading.Event().wait(self.retry_delay)
+            if self.conn is None:
+                continue
+            try:
+                self.conn.execute(text("SELECT 1"))
+            except Exception as e:
+                print(f"leader lost its lock connection, exiting: {e}")
+                os._exit(1)
+
+    def run(self):
+        with self.app.app_context():
+            postgres = db.engine.dialect.name == "postgresql"
+            while not self.is_leader:
+                try:
+                    self.is_leader = self.try_postgres_lock() if postgres else self.try_file_lock()
+                except Exception as e:
+                    print(f"leader election failed: {e}")
+                    if self.conn is not None:
+                        self.conn.close()
+                        self.conn = None
+                if not self.is_leader:
+                    threading.Event().wait(self.retry_delay)
+
+            print(f"process {os.getpid()} is the leader")
+            self.on_elected()
+            self.hold_lock()
@@ -0,0 +1,325 @@
+from flask import Response, request, g, has_request_context, abort
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from bisect import bisect_left
+import threading
+import hmac
+import json
+import time
+import os
+
+# seconds, from a fast cached view up to a slow chart build
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34)
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def format_labels(names, values, extra=None):
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    """Monotonic count per label set"""
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def snapshot(self):
+        with self.lock:
+            return [[list(labels), value] for labels, value in self.values.items()]
+
+    # totals over the snapshots of every process, {process: rows}
+    @staticmethod
+    def merge(snapshots):
+        values = {}
+        for rows in snapshots.values():
+            for labels, value in rows:
+                values[tuple(labels)] = values.get(tuple(labels), 0) + value
+        return values
+
+    def render(self, values=None):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        if values is None:
+            with self.lock:
+                values = dict(self.values)
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{format_labels(self.labels, labels)} {value}")
+        return lines
+
+class Histogram:
+    """Bucketed observations per label set, cumulated only when scraped"""
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    # one bisect and a few additions under the lock
+    def observe(self, value, *labels):
+        i = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.values.get(labels)
+            if series is None:
+                series = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    # context manager timing its block in seconds
+    def time(self, *labels):
+        return Timer(self, labels)
+
+    def snapshot(self):
+        with self.lock:
+            return [[list(labels), list(counts), total] for labels, (counts, total) in self.values.items()]
+
+    @staticmethod
+    def merge(snapshots):
+        values = {}
+        for rows in snapshots.values():
+            for labels, counts, total in rows:
+                merged = values.setdefault(tuple(labels), ([0] * len(counts), [0.0]))
+                for i, count in enumerate(counts):
+                    merged[0][i] += count
+                merged[1][0] += total
+        return {labels: (counts, total[0]) for labels, (counts, total) in values.items()}
+
+    def render(self, values=None):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        if values is None:
+            with self.lock:
+                values = {labels: (list(counts), total) for labels, (counts, total) in self.values.items()}
+        for labels, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{format_labels(self.labels, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, labels)} {total}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, labels)} {cumulative}")
+        return lines
+
+class Timer:
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+class Gauge:
+    """Value read from a callback at scrape time, {label tuple: value} or a number"""
+
+    def __init__(self, name, help_text, read, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.read = read
+        self.labels = labels
+
+    def current(self):
+        try:
+            values = self.read()
+        except Exception as e:
+            print(f"metrics gauge {self.name} failed: {e}")
+            return {}
+        return values if isinstance(values, dict) else {(): values}
+
+    def snapshot(self):
+        return [[list(labels), value] for labels, value in self.current().items()]
+
+    # gauges don't add up across processes, each keeps its own series labelled with its pid
+    @staticmethod
+    def merge(snapshots):
+        return {tuple(labels) + (pid,): value for pid, rows in snapshots.items() for labels, value in rows}
+
+    def render(self, values=None):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        names = self.labels if values is None else self.labels + ("pid",)
+        values = self.current() if values is None else values
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{format_labels(names, labels)} {value}")
+        return lines
+
+class Registry:
+    """Metrics rendered in the prometheus text format.
+
+    On its own the registry reports this process. Once shared through a
+    directory, every process writes a snapshot there every few seconds and
+    a scrape answered by any of them sums the counters and histograms of
+    all of them, so series kept by the leader alone are always present and
+    counters only move forward. Snapshots of exited workers are kept so
+    their counts still add up, only their gauges are dropped.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.directory = None
+        self.snapshot_path = None
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    # write this process's snapshot to directory every interval seconds
+    def share(self, directory, interval=5):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.snapshot_path = os.path.join(directory, f"{os.getpid()}-{time.time_ns()}.json")
+        threading.Thread(target=self.share_loop, args=(interval,), daemon=True).start()
+
+    def share_loop(self, interval):
+        while True:
+            try:
+                self.dump()
+            except Exception as e:
+                print(f"failed to write metrics snapshot: {e}")
+            time.sleep(interval)
+
+    def dump(self):
+        snapshot = {"pid": os.getpid(), "metrics": {metric.name: metric.snapshot() for metric in self.metrics}}
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, self.snapshot_path)
+
+    # (file, pid, {metric name: rows}, whether the process is still running) per snapshot
+    def load_snapshots(self):
+        snapshots = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            snapshots.append((name, snapshot["pid"], snapshot["metrics"], pid_alive(snapshot["pid"])))
+        return snapshots
+
+    def render(self):
+        lines = []
+        if not self.directory:
+            for metric in self.metrics:
+                lines.extend(metric.render())
+            return "\n".join(lines) + "\n"
+
+        self.dump()
+        snapshots = self.load_snapshots()
+        for metric in self.metrics:
+            if isinstance(metric, Gauge):
+                rows = {pid: values.get(metric.name, []) for _, pid, values, alive in snapshots if alive}
+            else:
+                rows = {name: values.get(metric.name, []) for name, _, values, _ in snapshots}
+            lines.extend(metric.render(metric.merge(rows)))
+        return "\n".join(lines) + "\n"
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+REGISTRY = Registry()
+
+http_latency = REGISTRY.add(Histogram(
+    "awsite_http_request_duration_seconds", "Time spent handling a request", ("route", "method", "status")))
+sql_per_request = REGISTRY.add(Histogram(
+    "awsite_http_request_queries", "SQL statements run while handling a request", ("route",), QUERY_COUNT_BUCKETS))
+sql_time_per_request = REGISTRY.add(Histogram(
+    "awsite_http_request_query_seconds", "Time spent in SQL while handling a request", ("route",)))
+sql_latency = REGISTRY.add(Histogram(
+    "awsite_db_query_duration_seconds", "Time per SQL statement", ("context",)))
+rate_limited = REGISTRY.add(Counter(
+    "awsite_rate_limited_total", "Requests rejected by the rate limiter", ("route",)))
+arduino_loop = REGISTRY.add(Histogram(
+    "awsite_arduino_loop_seconds", "Work done per wakeup of the arduino loop, excluding the wait"))
+serial_read = REGISTRY.add(Histogram(
+    "awsite_serial_read_seconds", "Time per serial read"))
+serial_write = REGISTRY.add(Histogram(
+    "awsite_serial_write_seconds", "Time per serial frame write"))
+flush_latency = REGISTRY.add(Histogram(
+    "awsite_writebehind_flush_seconds", "Time per write-behind flush transaction", ("outcome",)))
+flush_records = REGISTRY.add(Counter(
+    "awsite_writebehind_records_total", "Sensor records committed by the write-behind buffer"))
+
+def route_name():
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
+# statement timings, attributed to the request being handled when there is one
+@event.listens_for(Engine, "before_cursor_execute")
+def before_query(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+@event.listens_for(Engine, "after_cursor_execute")
+def after_query(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("metrics_query_start")
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    in_request = has_request_context()
+    sql_latency.observe(elapsed, "request" if in_request else "background")
+    if in_request and "metrics_start" in g:
+        g.metrics_queries += 1
+        g.metrics_query_time += elapsed
+
+@event.listens_for(Engine, "handle_error")
+def failed_query(context):
+    starts = context.connection.info.get("metrics_query_start") if context.connection else None
+    if starts:
+        starts.pop()
+
+def start_request():
+    g.metrics_start = time.perf_counter()
+    g.metrics_queries = 0
+    g.metrics_query_time = 0.0
+
+def finish_request(response):
+    if "metrics_start" not in g:
+        return response
+    route = route_name()
+    http_latency.observe(time.perf_counter() - g.metrics_start, route, request.method, response.status_code)
+    sql_per_request.observe(g.metrics_queries, route)
+    sql_time_per_request.observe(g.metrics_query_time, route)
+    if response.status_code == 429:
+        rate_limited.inc(route)
+    return response
+
+# scrape response, only with the METRICS_TOKEN bearer token, and not served at all without one set
+def render_response():
+    token = os.getenv("METRICS_TOKEN")
+    if not token:
+        abort(404)
+    if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        abort(401)
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+# register before the limiter so its rejections are timed too
+def init_app(app):
+    app.before_request(start_request)
+    app.after_request(finish_request)
+
+    # gunicorn.conf.py points every worker at one directory, /metrics then covers them all
+    directory = os.getenv("METRICS_DIR")
+    if directory:
+        REGISTRY.share(directory)
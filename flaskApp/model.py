@@ -1,10 +1,44 @@
 from flask_sqlalchemy import SQLAlchemy
+from flask import has_app_context
 from datetime import date, timedelta, datetime
 import datetime as dt
-from sqlalchemy import func
+from sqlalchemy import func, text
+from blinker import signal
+import threading
+import socket
+import json
+import time
+import os
 
 db = SQLAlchemy()
 
+# sent whenever the cached arduino state changes or new readings are committed
+arduino_state_changed = signal("arduino-state-changed")
+temperature_added = signal("temperature-added")
+fish_chosen = signal("fish-chosen")
+colors_requested = signal("colors-requested")
+
+# postgres channel other processes listen on to keep their caches in step
+STATE_CHANNEL = "awsite_state"
+
+def process_id():
+    """Identifies this process in notifications, so it can skip its own"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def notify(kind, **payload):
+    """Queue a notification on the current transaction, sent when it commits (postgres only)"""
+
+    # callers without an app context keep their local change, only the broadcast is skipped
+    if not has_app_context():
+        print(f"not broadcasting {kind}: no app context")
+        return False
+    if db.engine.dialect.name != "postgresql":
+        return False
+    payload.update(kind=kind, origin=process_id())
+    db.session.execute(text("SELECT pg_notify(:channel, :payload)"),
+                       {"channel": STATE_CHANNEL, "payload": json.dumps(payload)})
+    return True
+
 class User(db.Model):
     __tablename__ = "users"
     id = db.Column(db.Integer, primary_key=True)
@@ -16,29 +50,98 @@ class TemperatureData(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     avg_temp = db.Column(db.Float, nullable=False)
+    min_temp = db.Column(db.Float)
+    max_temp = db.Column(db.Float)
+    stddev_temp = db.Column(db.Float)
+    sample_count = db.Column(db.Integer)
 
     @classmethod
-    def add_temp(cls, avg_temp, timestamp=None):
+    def add_temp(cls, avg_temp, timestamp=None, commit=True, min_temp=None, max_temp=None,
+                 stddev_temp=None, sample_count=None):
         new_reading = cls(
             avg_temp=avg_temp,
-            timestamp=timestamp if timestamp else datetime.utcnow()
+            timestamp=timestamp if timestamp else datetime.utcnow(),
+            min_temp=min_temp,
+            max_temp=max_temp,
+            stddev_temp=stddev_temp,
+            sample_count=sample_count
         )
         db.session.add(new_reading)
-        db.session.commit()
+        if commit:
+            notify("temperature", temp=None, hourly=True)
+            db.session.commit()
+            temperature_added.send(cls, temp=None, hourly=True)
         return new_reading
     
+    @classmethod
+    def has_hour(cls, timestamp):
+        """Whether the rollup stamped at this time is already stored"""
+        return db.session.query(cls.id).filter(cls.timestamp == timestamp).first() is not None
+
     @classmethod
     def get_all(cls):
-        """Get all temperature readings (max 24 due to trigger)"""
+        """Get all hourly temperature readings"""
         return cls.query.order_by(cls.timestamp.desc()).all()
-    
+
     @classmethod
-    def cleanup_excess_entries(cls):
-        """Manually trigger cleanup to maintain 24-entry limit"""
-        subquery = cls.query.order_by(cls.timestamp.desc()).offset(24).subquery()
-        deleted_count = cls.query.filter(cls.id.in_(db.session.query(subquery.c.id))).delete(synchronize_session=False)
+    def get_range(cls, start, end=None):
+        """Get hourly readings between start and end, oldest first"""
+        query = cls.query.filter(cls.timestamp >= start)
+        if end:
+            query = query.filter(cls.timestamp < end)
+        return query.order_by(cls.timestamp).all()
+
+class TemperatureDaily(db.Model):
+    __tablename__ = 'temperature_daily'
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, unique=True, nullable=False)
+    avg_temp = db.Column(db.Float, nullable=False)
+    min_temp = db.Column(db.Float, nullable=False)
+    max_temp = db.Column(db.Float, nullable=False)
+    sample_count = db.Column(db.Integer, nullable=False)
+
+    @property
+    def timestamp(self):
+        """Midday of the rollup day, so daily rows chart like the other tiers"""
+        return datetime.combine(self.day, dt.time(12))
+
+    @classmethod
+    def get_range(cls, start, end=None):
+        """Get daily rollups between start and end, oldest first"""
+        query = cls.query.filter(cls.day >= start.date())
+        if end:
+            query = query.filter(cls.day < end.date())
+        return query.order_by(cls.day).all()
+
+    @classmethod
+    def rollup(cls, today=None):
+        """Roll completed days of hourly readings into the daily tier"""
+        today = today if today else datetime.utcnow().date()
+        last = db.session.query(func.max(cls.day)).scalar()
+        if last:
+            day = last + timedelta(days=1)
+        else:
+            first = db.session.query(func.min(TemperatureData.timestamp)).scalar()
+            if not first:
+                return 0
+            day = first.date()
+
+        added = 0
+        while day < today:
+            start = datetime.combine(day, dt.time())
+            avg_temp, min_temp, max_temp, count = db.session.query(
+                func.avg(TemperatureData.avg_temp),
+                func.min(func.coalesce(TemperatureData.min_temp, TemperatureData.avg_temp)),
+                func.max(func.coalesce(TemperatureData.max_temp, TemperatureData.avg_temp)),
+                func.count(TemperatureData.id)
+            ).filter(TemperatureData.timestamp >= start, TemperatureData.timestamp < start + timedelta(days=1)).one()
+            if count:
+                db.session.add(cls(day=day, avg_temp=round(float(avg_temp), 1), min_temp=min_temp,
+                                   max_temp=max_temp, sample_count=count))
+                added += 1
+            day += timedelta(days=1)
         db.session.commit()
-        return deleted_count
+        return added
 
 class CurrentTemperature(db.Model):
     __tablename__ = 'current_temperature'
@@ -52,30 +155,58 @@ class CurrentTemperature(db.Model):
         return cls.query.order_by(cls.timestamp.desc()).first()
     
     @classmethod
-    def get_last_hour(cls):
-        """Get all temperature readings from the last hour"""
-        one_hour_ago = datetime.utcnow() - timedelta(minutes=dt.datetime.now().minute)
-        return cls.query.filter(cls.timestamp >= one_hour_ago).order_by(cls.timestamp.desc()).all()
+    def get_range(cls, start, end=None):
+        """Get minute readings between start and end, oldest first"""
+        query = cls.query.filter(cls.timestamp >= start)
+        if end:
+            query = query.filter(cls.timestamp < end)
+        return query.order_by(cls.timestamp).all()
     
     @classmethod
-    def add_temp(cls, temp, timestamp=None):
+    def add_temp(cls, temp, timestamp=None, commit=True):
         """Add a single temperature reading"""
         new_temp = cls(
             current_temp=temp,
             timestamp=timestamp if timestamp else datetime.utcnow()
         )
         db.session.add(new_temp)
-        db.session.commit()
-        cls.cleanup_old_readings()
+        if commit:
+            notify("temperature", temp=float(temp), hourly=False)
+            db.session.commit()
+            temperature_added.send(cls, temp=float(temp), hourly=False)
         return new_temp
-    
+
+class RetentionPolicy:
+    """How long each temperature tier is kept, pruned in bulk by the retention worker"""
+    raw = timedelta(hours=int(os.getenv("TEMP_RAW_RETENTION_HOURS", "48")))
+    hourly = timedelta(days=int(os.getenv("TEMP_HOURLY_RETENTION_DAYS", "31")))
+    daily = timedelta(days=int(os.getenv("TEMP_DAILY_RETENTION_DAYS", "730")))
+
+    # window name -> (span, tier, chart label format)
+    windows = {
+        "24h": (timedelta(hours=24), TemperatureData, '%I:%M %p'),
+        "7d": (timedelta(days=7), TemperatureData, '%a %I %p'),
+        "30d": (timedelta(days=30), TemperatureDaily, '%b %d')}
+
+    @classmethod
+    def get_window(cls, window):
+        """Get the readings for a named window from the tier that covers it"""
+        span, tier, _ = cls.windows[window]
+        return tier.get_range(datetime.utcnow() - span)
+
     @classmethod
-    def cleanup_old_readings(cls):
-        """Delete all readings older than 1 hour"""
-        one_hour_ago = datetime.utcnow() - timedelta(minutes=dt.datetime.now().minute)
-        deleted_count = cls.query.filter(cls.timestamp < one_hour_ago).delete()
+    def prune(cls, now=None):
+        """Delete everything past retention, one range delete per tier"""
+        now = now if now else datetime.utcnow()
+        deleted = {
+            "raw": CurrentTemperature.query.filter(
+                CurrentTemperature.timestamp < now - cls.raw).delete(synchronize_session=False),
+            "hourly": TemperatureData.query.filter(
+                TemperatureData.timestamp < now - cls.hourly).delete(synchronize_session=False),
+            "daily": TemperatureDaily.query.filter(
+                TemperatureDaily.day < (now - cls.daily).date()).delete(synchronize_session=False)}
         db.session.commit()
-        return deleted_count
+        return deleted
     
 class RGBLightValue(db.Model):
     __tablename__ = 'rgb_light_vals'
@@ -85,6 +216,9 @@ class RGBLightValue(db.Model):
     green = db.Column(db.Integer, nullable=False)
     blue = db.Column(db.Integer, nullable=False)
 
+    _zones = None
+    _zones_lock = threading.Lock()
+
     @property
     def rgb_tuple(self):
         """Returns RGB values as a tuple"""
@@ -97,10 +231,60 @@ class RGBLightValue(db.Model):
     
     def update_color(self, red, green, blue):
         """Update the RGB values for this zone"""
-        self.red = red
-        self.green = green
-        self.blue = blue
-        db.session.commit()
+        RGBLightValue.set_colors({self.name: (red, green, blue)})
+
+    @classmethod
+    def load_zones(cls):
+        """Reload the zone color cache from the database"""
+        zones = {z.name: z.rgb_tuple for z in cls.query.order_by(cls.name).all()}
+        with cls._zones_lock:
+            cls._zones = zones
+        return dict(zones)
+
+    @classmethod
+    def get_zones(cls):
+        """{zone name: (r, g, b)} from the cache, loaded on first use"""
+        zones = cls._zones
+        if zones is None:
+            return cls.load_zones()
+        return dict(zones)
+
+    @classmethod
+    def cache_zones(cls, changes):
+        """Merge changed zone colors into the cache without touching the database"""
+        with cls._zones_lock:
+            zones = dict(cls._zones) if cls._zones is not None else {}
+            zones.update({name: tuple(rgb) for name, rgb in changes.items()})
+            cls._zones = dict(sorted(zones.items()))
+
+    @staticmethod
+    def check_color(rgb):
+        """Validated (r, g, b) tuple, raises ValueError otherwise"""
+        if not isinstance(rgb, (list, tuple)) or len(rgb) != 3:
+            raise ValueError(f"color must be [r, g, b], got {rgb!r}")
+        if not all(isinstance(c, int) and not isinstance(c, bool) and 0 <= c <= 255 for c in rgb):
+            raise ValueError(f"color channels must be integers 0-255, got {rgb!r}")
+        return tuple(rgb)
+
+    @classmethod
+    def set_colors(cls, changes):
+        """Apply {zone name: (r, g, b)} in one transaction and write through to the cache"""
+        changes = {name: cls.check_color(rgb) for name, rgb in changes.items()}
+        unknown = set(changes) - set(cls.get_zones())
+        if unknown:
+            raise ValueError(f"unknown zones: {', '.join(sorted(unknown))}")
+        if not changes:
+            return {}
+        for zone in cls.query.filter(cls.name.in_(changes)).all():
+            zone.red, zone.green, zone.blue = changes[zone.name]
+        notify("zones", zones=changes)
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        cls.cache_zones(changes)
+        return changes
 
 class FishOfTheWeek(db.Model):
     __tablename__ = 'fish_of_the_week'
@@ -108,84 +292,252 @@ class FishOfTheWeek(db.Model):
     wiki_url = db.Column(db.String(500), unique=True, nullable=False)
     fish_name = db.Column(db.String(200), nullable=False)
     last_chosen_week = db.Column(db.Date, nullable=True)
-    
+
+    _generation = 0
+
+    @classmethod
+    def generation(cls):
+        """Counter that changes whenever the chosen fish set changes"""
+        return cls._generation
+
     @classmethod
-    def get_random_fish(cls):
-        """Get a random fish that hasn't been chosen recently"""
-        # Find fish not chosen in last 12 weeks, or never chosen
-        today = date.today()
-        monday = today - timedelta(days=today.weekday())
-        cutoff_date = monday - timedelta(weeks=13)
-        fish = cls.query.filter(
-            (cls.last_chosen_week == None) | (cls.last_chosen_week < cutoff_date)
-        ).order_by(func.random()).first()
-        return fish
+    def bump_generation(cls, broadcast=True):
+        """Invalidate anything cached for the current fish set, in every process"""
+        cls._generation += 1
+        fish_chosen.send(cls, generation=cls._generation)
+        if broadcast and notify("fish"):
+            db.session.commit()
     
+    COOLDOWN_WEEKS = 13
+
+    @staticmethod
+    def current_week(today=None):
+        """Monday of the week containing today"""
+        today = today if today else date.today()
+        return today - timedelta(days=today.weekday())
+
+    @classmethod
+    def cooldown_cutoff(cls, today=None):
+        """Fish chosen on or after this week are still cooling down"""
+        return cls.current_week(today) - timedelta(weeks=cls.COOLDOWN_WEEKS)
+
+    @classmethod
+    def catalog(cls):
+        """(id, fish_name, last_chosen_week) for every fish, without loading models"""
+        return db.session.execute(db.select(cls.id, cls.fish_name, cls.last_chosen_week)).all()
+
+    @classmethod
+    def links(cls):
+        """(fish_name, wiki_url) for every fish, by name"""
+        return db.session.execute(db.select(cls.fish_name, cls.wiki_url).order_by(cls.fish_name)).all()
+
+    @classmethod
+    def catalog_signature(cls):
+        """Cheap summary that changes when fish are added or removed"""
+        return tuple(db.session.execute(db.select(func.count(cls.id), func.max(cls.id))).one())
+
     def mark_as_chosen(self):
         """Mark this fish as chosen for current week"""
-        from datetime import date, timedelta
-        today = date.today()
-        monday = today - timedelta(days=today.weekday())
-        self.last_chosen_week = monday
+        self.last_chosen_week = FishOfTheWeek.current_week()
         db.session.commit()
+        FishOfTheWeek.bump_generation()
 
-    """
     @classmethod
-    def get_all(cls):
-        return cls.query.order_by(cls.fish_name).all()
-    """
+    def get_fish(cls, limit=12):
+        return cls.history(limit=limit)[0]
 
     @classmethod
-    def get_fish(cls):
-        return cls.query.filter(cls.last_chosen_week != None).order_by(cls.last_chosen_week.desc()).limit(12).all()
+    def history(cls, before=None, limit=12):
+        """Chosen fish newest first, after the (week, id) key of the last page, and the key for the next page"""
+        query = cls.query.filter(cls.last_chosen_week != None)
+        if before:
+            week, fish_id = before
+            query = query.filter(cls.last_chosen_week <= week,
+                                 db.or_(cls.last_chosen_week < week, cls.id < fish_id))
+        fish = query.order_by(cls.last_chosen_week.desc(), cls.id.desc()).limit(limit + 1).all()
+        if len(fish) <= limit:
+            return fish, None
+        fish = fish[:limit]
+        return fish, (fish[-1].last_chosen_week, fish[-1].id)
 
 class Arduino(db.Model):
     __tablename__ = 'arduino'
     id = db.Column(db.Integer, primary_key=True)
-    port = db.Column(db.String(100), nullable=False)
+    name = db.Column(db.String(100), unique=True)
+    port = db.Column(db.String(100), unique=True, nullable=False)
     state = db.Column(db.String(20), nullable=False)
+    zones = db.Column(db.Text)
+    sensor = db.Column(db.Boolean, nullable=False, default=True)
+    failures = db.Column(db.Integer, nullable=False, default=0)
+    retry_at = db.Column(db.DateTime)
 
+    _devices = None
+    _devices_lock = threading.Lock()
     _cached_state = None
-    _cache_initialized = False
+
+    @property
+    def zone_list(self):
+        """Zone names in board order, None when the board drives every zone"""
+        if self.zones is None:
+            return None
+        return [zone.strip() for zone in self.zones.split(",") if zone.strip()]
+
+    def as_dict(self):
+        """The cached form of this board"""
+        return {"id": self.id, "name": self.name if self.name else self.port, "port": self.port,
+                "state": self.state, "zones": self.zone_list, "sensor": self.sensor,
+                "failures": self.failures or 0, "retry_at": self.retry_at}
 
     @classmethod
     def initialize_cache(cls):
-        if not cls._cache_initialized:
-            arduino = cls.query.first()
-            if arduino:
-                cls._cached_state = arduino.state
-                cls._cache_initialized = True
+        if cls._devices is None:
+            cls.refresh_cache()
+
+    @classmethod
+    def refresh_cache(cls, keep_state=False):
+        """Reload every board from the database, keeping cached states not yet written if asked"""
+        devices = {arduino.id: arduino.as_dict() for arduino in cls.query.order_by(cls.id).all()}
+        with cls._devices_lock:
+            if keep_state and cls._devices:
+                for device_id, device in devices.items():
+                    if device_id in cls._devices:
+                        device["state"] = cls._devices[device_id]["state"]
+            cls._devices = devices
+        cls.publish_state()
+
+    @classmethod
+    def get_devices(cls):
+        """Cached boards as dicts, ordered by id"""
+        cls.initialize_cache()
+        return [dict(device) for device in cls._devices.values()]
+
+    @staticmethod
+    def combined_state(states):
+        """Updating while any board is, online while any board is up"""
+        if "update" in states:
+            return "update"
+        if "online" in states:
+            return "online"
+        return "offline"
+
+    @classmethod
+    def publish_state(cls):
+        state = cls.combined_state({device["state"] for device in cls._devices.values()})
+        if state != cls._cached_state:
+            cls._cached_state = state
+            arduino_state_changed.send(cls, state=state)
 
     @classmethod
-    def get_state(cls):
-        """Get the current Arduino state"""
-        return cls._cached_state
+    def get_state(cls, device_id=None):
+        """State of one board, or of all of them combined"""
+        cls.initialize_cache()
+        if device_id is None:
+            return cls._cached_state
+        device = cls._devices.get(device_id)
+        return device["state"] if device else None
 
     @classmethod
     def get_port(cls):
-        """Get the current Arduino port"""
-        return cls.query.first().port
-    
+        """Ports of every board"""
+        return ", ".join(device["port"] for device in cls.get_devices())
+
     @classmethod
-    def update_state(cls, new_state):
-        """Update Arduino state in both cache and database"""
-        arduino = cls.query.first()
-        if arduino:
+    def cache_device(cls, device_id, **changes):
+        """Update one board's cached fields, the database write is deferred"""
+        with cls._devices_lock:
+            device = cls._devices.get(device_id) if cls._devices is not None else None
+            if device is None:
+                return
+            cls._devices[device_id] = dict(device, **changes)
+        if "state" in changes:
+            cls.publish_state()
+
+    @classmethod
+    def cache_port(cls, device_id, port):
+        """Update only the cached port"""
+        cls.cache_device(device_id, port=port)
+
+    @classmethod
+    def cache_state(cls, device_id, new_state):
+        """Update only the cached state, the database write is deferred"""
+        if new_state != cls.get_state(device_id):
+            cls.cache_device(device_id, state=new_state)
+
+    @classmethod
+    def update_state(cls, new_state, device_id=None, commit=True):
+        """Update a board's state in both cache and database, every connected board without an id"""
+        if device_id is None:
+            arduinos = cls.query.filter(cls.state != "offline").all()
+        else:
+            arduinos = cls.query.filter(cls.id == device_id).all()
+        for arduino in arduinos:
             arduino.state = new_state
-            cls._cached_state = new_state 
+            cls.cache_state(arduino.id, new_state)
+            notify("arduino", id=arduino.id, state=new_state)
+        if commit:
             try:
                 db.session.commit()
             except Exception as e:
                 db.session.rollback()
                 print(f"Error updating Arduino state: {e}")
                 raise
+        return arduinos
+
+    @classmethod
+    def update_backoff(cls, device_id, failures, retry_at, commit=True):
+        """Record a board's failed connection attempts and when to try next"""
+        arduino = db.session.get(cls, device_id)
+        if arduino:
+            arduino.failures = failures
+            arduino.retry_at = retry_at
+            cls.cache_device(device_id, failures=failures, retry_at=retry_at)
+            if commit:
+                db.session.commit()
         return arduino
 
     @classmethod
-    def update_port(cls, port):
-        """Update Arduino port"""
-        arduino = cls.query.first()
+    def devices_for_zones(cls, zones):
+        """Ids of the boards driving any of these zones"""
+        zones = set(zones)
+        return [device["id"] for device in cls.get_devices()
+                if device["zones"] is None or zones.intersection(device["zones"])]
+
+    @classmethod
+    def request_colors(cls, requested_at=None, zones=None):
+        """Ask whichever process owns the boards to push the current colors of these zones, all without"""
+        requested_at = requested_at if requested_at else time.time()
+        zones = list(zones) if zones is not None else None
+        colors_requested.send(cls, requested_at=requested_at, zones=zones)
+        notify("colors", requested_at=requested_at, zones=zones)
+        db.session.commit()
+
+    @classmethod
+    def update_port(cls, device_id, port):
+        """Update a board's port"""
+        arduino = db.session.get(cls, device_id)
         if arduino:
             arduino.port = port
+            cls.cache_port(device_id, port)
+            notify("port", id=device_id, port=port)
         db.session.commit()
-        return arduino
\ No newline at end of file
+        return arduino
+
+    @classmethod
+    def discover(cls, ports):
+        """Add a board for each port not seen before, with no zones and no sensor until configured"""
+        known = {device["port"] for device in cls.get_devices()}
+        new_ports = sorted(set(ports) - known)
+        if not new_ports:
+            return []
+        for port in new_ports:
+            db.session.add(cls(name=port.rsplit("/", 1)[-1], port=port, state="offline", zones="",
+                               sensor=False, failures=0))
+        notify("devices")
+        try:
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"failed to add discovered boards {new_ports}: {e}")
+            return []
+        cls.refresh_cache()
+        return new_ports
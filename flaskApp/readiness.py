@@ -0,0 +1,113 @@
+import threading
+import time
+
+class Readiness:
+    """Warm-up state of each subsystem of this process, reported by /readyz.
+
+    A subsystem is pending until its warm-up first runs, then warming, then
+    ready or failed, with how long the last attempt took. Only required ones
+    hold back readiness, the leader's background work is reported as it goes.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.subsystems = {}
+
+    def expect(self, name, required=True):
+        with self.lock:
+            self.subsystems.setdefault(name, {"state": "pending", "required": required, "seconds": None, "error": None})
+
+    def update(self, name, **changes):
+        with self.lock:
+            self.subsystems[name].update(changes)
+
+    # context manager timing one warm-up attempt, exceptions still propagate
+    def step(self, name, required=True):
+        return Step(self, name, required)
+
+    def is_ready(self):
+        with self.lock:
+            return all(s["state"] == "ready" for s in self.subsystems.values() if s["required"])
+
+    def report(self):
+        with self.lock:
+            subsystems = {name: dict(s) for name, s in self.subsystems.items()}
+        return {
+            "ready": all(s["state"] == "ready" for s in subsystems.values() if s["required"]),
+            "uptime": round(time.monotonic() - self.started, 3),
+            "subsystems": subsystems}
+
+class Step:
+
+    def __init__(self, readiness, name, required):
+        self.readiness = readiness
+        self.name = name
+        self.readiness.expect(name, required)
+
+    def __enter__(self):
+        self.readiness.update(self.name, state="warming")
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = round(time.perf_counter() - self.start, 4)
+        if exc is None:
+            self.readiness.update(self.name, state="ready", seconds=seconds, error=None)
+        else:
+            self.readiness.update(self.name, state="failed", seconds=seconds, error=str(exc))
+        return False
+
+READINESS = Readiness()
+
+class Warmup(threading.Thread):
+    """Fills this process's caches in the background so requests are served from the start.
+
+    Every step runs in an app context, and failed steps are retried with
+    backoff, so a worker that boots before the database is up answers
+    /healthz right away and turns ready once the database is reachable.
+    Requests that arrive first still work, each cache loads itself on demand.
+    """
+
+    def __init__(self, app, readiness=READINESS, retry_delay=1, max_backoff=30):
+        super(Warmup, self).__init__()
+        self.app = app
+        self.daemon = True
+        self.readiness = readiness
+        self.retry_delay = retry_delay
+        self.max_backoff = max_backoff
+        self.steps = []
+        self.started = False
+        self.lock = threading.Lock()
+
+    def add(self, name, func, required=True):
+        self.steps.append((name, func))
+        self.readiness.expect(name, required)
+
+    # start once per process, safe to call from every request
+    def ensure_started(self):
+        if self.started:
+            return
+        with self.lock:
+            if not self.started:
+                self.started = True
+                self.start()
+
+    def run(self):
+        pending = list(self.steps)
+        delay = self.retry_delay
+        while True:
+            failed = []
+            for name, func in pending:
+                try:
+                    with self.app.app_context(), self.readiness.step(name):
+                        func()
+                except Exception as e:
+                    print(f"warm-up of {name} failed: {e}")
+                    failed.append((name, func))
+            pending = failed
+            if not pending:
+                print(f"process warm after {self.readiness.report()['uptime']}s")
+                return
+            threading.Event().wait(delay)
+            delay = min(delay * 2, self.max_backoff)
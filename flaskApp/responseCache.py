@@ -0,0 +1,64 @@
+from flask import Response, request
+import threading
+import hashlib
+
+class ResponseCache:
+    """In-process cache of encoded response bodies, valid for a single generation.
+
+    Entries are keyed by name and tagged with the generation they were built
+    for; when the generation moves on the whole cache is dropped. Every body
+    carries a strong ETag so repeat clients can be answered with a 304.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.generation = None
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    # returns (body, etag), calling build() only when the entry is missing or stale,
+    # a key of None builds every time and stores nothing
+    def get(self, key, generation, build):
+        if key is None:
+            body = build()
+            return (body, hashlib.sha1(body).hexdigest()) if body is not None else (None, None)
+        with self.lock:
+            if generation != self.generation:
+                self.entries.clear()
+                self.generation = generation
+            entry = self.entries.get(key)
+            if entry:
+                self.hits += 1
+                return entry
+        body = build()
+        if body is None:
+            return None, None
+        entry = (body, hashlib.sha1(body).hexdigest())
+        with self.lock:
+            self.misses += 1
+            if generation == self.generation:
+                self.entries[key] = entry
+        return entry
+
+    # full response, or an empty 304 when the client already has this version
+    def respond(self, body, etag, mimetype, cache_control):
+        if request.if_none_match.contains(etag):
+            with self.lock:
+                self.not_modified += 1
+            response = Response(status=304)
+        else:
+            response = Response(body, mimetype=mimetype)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = cache_control
+        return response
+
+    def stats(self):
+        with self.lock:
+            return {
+                "generation": self.generation,
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified}
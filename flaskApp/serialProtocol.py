@@ -0,0 +1,106 @@
+from collections import namedtuple
+import binascii
+import struct
+
+# frame layout, little-endian, shared with arduino/sketch_jul3a.ino:
+#   magic (2) | type (1) | seq (1) | len (1) | payload (len) | crc16 (2)
+# the crc is CRC-16/CCITT (poly 0x1021, init 0xFFFF) over type..payload
+MAGIC = b"\xa5\x5a"
+HEADER = struct.Struct("<BBB")
+CRC = struct.Struct("<H")
+MAX_PAYLOAD = 64
+
+# frame types
+COLORS = 0x01   # host -> board, (zone, r, g, b) per zone
+ACK = 0x02      # board -> host, (acked seq, status)
+TEMP = 0x03     # board -> host, float32 reading
+HELLO = 0x04    # board -> host, sent once after a reset
+LOG = 0x05      # board -> host, ascii text
+
+# ack status
+ACK_OK = 0
+ACK_BAD_PAYLOAD = 1
+
+ZONE = struct.Struct("<BBBB")
+MAX_ZONES = MAX_PAYLOAD // ZONE.size
+ACK_PAYLOAD = struct.Struct("<BB")
+TEMP_PAYLOAD = struct.Struct("<f")
+
+Frame = namedtuple("Frame", ["type", "seq", "payload"])
+
+def crc16(data):
+    return binascii.crc_hqx(data, 0xFFFF)
+
+def encode(frame_type, seq, payload=b""):
+    if len(payload) > MAX_PAYLOAD:
+        raise ValueError(f"payload of {len(payload)} bytes is over {MAX_PAYLOAD}")
+    body = HEADER.pack(frame_type, seq & 0xFF, len(payload)) + payload
+    return MAGIC + body + CRC.pack(crc16(body))
+
+# zones is a list of (r, g, b), numbered in order from first, at most MAX_ZONES a frame
+def encode_colors(seq, zones, first=0):
+    return encode(COLORS, seq, b"".join(ZONE.pack(first + i, *rgb) for i, rgb in enumerate(zones)))
+
+def decode_colors(payload):
+    return [(zone, (r, g, b)) for zone, r, g, b in ZONE.iter_unpack(payload)]
+
+def encode_ack(seq, acked, status=ACK_OK):
+    return encode(ACK, seq, ACK_PAYLOAD.pack(acked & 0xFF, status))
+
+def decode_ack(payload):
+    return ACK_PAYLOAD.unpack(payload)
+
+def encode_temp(seq, temp):
+    return encode(TEMP, seq, TEMP_PAYLOAD.pack(temp))
+
+def decode_temp(payload):
+    return TEMP_PAYLOAD.unpack(payload)[0]
+
+class FrameDecoder:
+    """Splits a serial byte stream into frames.
+
+    Bytes are buffered until a whole frame has arrived. Anything that isn't
+    a frame with a good crc (line noise, a half frame from before a reset)
+    is skipped one byte at a time until the next magic lines up.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.frames = 0
+        self.dropped = 0
+
+    def reset(self):
+        self.buffer.clear()
+
+    # returns every complete frame now in the buffer
+    def feed(self, data):
+        self.buffer += data
+        frames = []
+        while True:
+            start = self.buffer.find(MAGIC)
+            if start < 0:
+                keep = 1 if self.buffer[-1:] == MAGIC[:1] else 0
+                self.dropped += len(self.buffer) - keep
+                del self.buffer[:len(self.buffer) - keep]
+                return frames
+            if start:
+                self.dropped += start
+                del self.buffer[:start]
+            if len(self.buffer) < len(MAGIC) + HEADER.size:
+                return frames
+            frame_type, seq, length = HEADER.unpack_from(self.buffer, len(MAGIC))
+            end = len(MAGIC) + HEADER.size + length + CRC.size
+            if length > MAX_PAYLOAD:
+                self.dropped += 1
+                del self.buffer[:1]
+                continue
+            if len(self.buffer) < end:
+                return frames
+            body = bytes(self.buffer[len(MAGIC):end - CRC.size])
+            if CRC.unpack_from(self.buffer, end - CRC.size)[0] != crc16(body):
+                self.dropped += 1
+                del self.buffer[:1]
+                continue
+            del self.buffer[:end]
+            self.frames += 1
+            frames.append(Frame(frame_type, seq, body[HEADER.size:]))
@@ -0,0 +1,95 @@
+from model import db, Arduino, RGBLightValue, FishOfTheWeek, STATE_CHANNEL, process_id, temperature_added, colors_requested
+from deviceManager import DeviceManager
+import threading
+import select
+import json
+
+class StateSync(threading.Thread):
+    """Keeps this process's caches coherent with every other worker.
+
+    Writers attach a pg_notify to the transaction that changes shared state,
+    and this thread LISTENs on one dedicated connection and replays each
+    message into the local caches and signals. Nothing is queried per request.
+    After a reconnect the caches are reloaded once, since messages sent while
+    the connection was down are lost.
+    """
+
+    def __init__(self, app, retry_delay=5):
+        super(StateSync, self).__init__()
+        self.app = app
+        self.daemon = True
+        self.retry_delay = retry_delay
+        self.started = False
+        self.lock = threading.Lock()
+
+    # start once per process, safe to call from every request
+    def ensure_started(self):
+        if self.started:
+            return
+        with self.lock:
+            if not self.started:
+                self.started = True
+                self.start()
+
+    def handle(self, payload):
+        message = json.loads(payload)
+        if message.get("origin") == process_id():
+            return
+        kind = message.get("kind")
+        if kind == "arduino":
+            Arduino.cache_state(message["id"], message["state"])
+        elif kind == "zones":
+            RGBLightValue.cache_zones(message["zones"])
+        elif kind == "port":
+            Arduino.cache_port(message["id"], message["port"])
+        elif kind == "devices":
+            Arduino.refresh_cache()
+        elif kind == "fish":
+            FishOfTheWeek.bump_generation(broadcast=False)
+        elif kind == "temperature":
+            temperature_added.send(self, temp=message["temp"], hourly=message["hourly"])
+        elif kind == "colors":
+            colors_requested.send(self, requested_at=message["requested_at"], zones=message.get("zones"))
+        elif kind == "latency":
+            DeviceManager.latency_samples.extend(message["samples"])
+
+    # reload everything a missed message could have changed
+    def resync(self):
+        Arduino.refresh_cache()
+        RGBLightValue.load_zones()
+        FishOfTheWeek.bump_generation(broadcast=False)
+        temperature_added.send(self, temp=None, hourly=True)
+        db.session.close()
+
+    def listen(self):
+        conn = db.engine.raw_connection()
+        conn.detach()
+        try:
+            conn.dbapi_connection.autocommit = True
+            cursor = conn.cursor()
+            cursor.execute(f"LISTEN {STATE_CHANNEL}")
+            self.resync()
+            while True:
+                if select.select([conn.dbapi_connection], [], [], 60) == ([], [], []):
+                    continue
+                conn.dbapi_connection.poll()
+                while conn.dbapi_connection.notifies:
+                    note = conn.dbapi_connection.notifies.pop(0)
+                    try:
+                        self.handle(note.payload)
+                    except Exception as e:
+                        print(f"bad state notification {note.payload}: {e}")
+        finally:
+            conn.close()
+
+    def run(self):
+        with self.app.app_context():
+            if db.engine.dialect.name != "postgresql":
+                print("state sync needs postgres, caches are per-process")
+                return
+            while True:
+                try:
+                    self.listen()
+                except Exception as e:
+                    print(f"state sync lost its connection: {e}")
+                threading.Event().wait(self.retry_delay)
@@ -1,7 +1,10 @@
+let chartRange = "24h";
+
 google.charts.load('current', {packages:['corechart']});
 google.charts.setOnLoadCallback(loadChart);
 document.addEventListener("DOMContentLoaded", () => {
     show_selected_lights();
+    setup_range_buttons();
     onLoad();
 });
 
@@ -22,25 +25,99 @@ function hideLoading() {
 }
 
 async function onLoad(){
+    showLoading();
+    await updateDashboard();
+    hideLoading();
+    listen();
+}
+
+// falls back to polling when the push stream is unavailable
+function poll() {
     async function loop() {
         try { await updateDashboard();
         } catch (err) {
             console.error("Error updating data:", err); }
         setTimeout(loop, 15000); 
     }
-    showLoading();
-    await updateDashboard();
-    hideLoading();
     loop();
 }
 
+// status and temperature changes are pushed by the server
+function listen() {
+    if (!window.EventSource) {
+        poll();
+        return;}
+    const source = new EventSource('/api/stream');
+    source.addEventListener('status', (event) => {
+        showStatus(JSON.parse(event.data));
+    });
+    source.addEventListener('temperature', (event) => {
+        const data = JSON.parse(event.data);
+        if (data.ct !== null){
+            document.getElementById("ct").innerText = `${data.ct}°F`;}
+        if (data.hourly){
+            loadChart();}
+    });
+    source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED) {
+            console.error("Event stream closed, polling instead");
+            poll();}
+    };
+}
+
 function show_selected_lights(){
     const appElement = document.getElementById("app");
-    const colorData = JSON.parse(appElement.dataset.colors);
-    const doc_1 =  document.getElementById("z1_" + colorData.zone1);
-    const doc_2 =  document.getElementById("z2_" + colorData.zone2);
-    if (doc_1){doc_1.setAttribute('selected', 'true')}
-    if (doc_2){doc_2.setAttribute('selected', 'true')}
+    mark_selected_lights(JSON.parse(appElement.dataset.colors));
+    document.querySelectorAll('button[name="light"]').forEach(button => {
+        button.addEventListener('click', (event) => {
+            event.preventDefault();
+            set_lights(JSON.parse(button.value));
+        });
+    });
+}
+
+// colorData maps each zone to the name of its selected swatch
+function mark_selected_lights(colorData){
+    document.querySelectorAll('button[name="light"]').forEach(b => b.removeAttribute('selected'));
+    Object.entries(colorData).forEach(([zone, swatch]) => {
+        const button = document.getElementById(`${zone}_${swatch}`);
+        if (button){button.setAttribute('selected', 'true')}
+    });
+}
+
+// one request for any number of zones, presets included
+async function set_lights(light){
+    const body = light.zone.startsWith("all-") ?
+        {preset: light.zone} : {zones: {[light.zone]: [light.r, light.g, light.b]}};
+    try {
+        const response = await fetch('/api/lights', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': getCsrfToken()},
+            credentials: 'same-origin',
+            body: JSON.stringify(body)});
+        const data = await response.json();
+        if (!response.ok) {
+            if (data.csrf_expired) {
+                window.location.href = '/auth_page';
+                return;}
+            throw new Error(data.error);}
+        mark_selected_lights(data.selected);
+        showStatus(data);
+    } catch (err) {
+        console.error("Error setting lights:", err);}
+}
+
+function setup_range_buttons(){
+    document.querySelectorAll('button[name="range"]').forEach(button => {
+        button.addEventListener('click', () => {
+            document.querySelectorAll('button[name="range"]').forEach(b => b.removeAttribute('selected'));
+            button.setAttribute('selected', 'true');
+            chartRange = button.value;
+            loadChart();
+        });
+    });
 }
 
 async function updateDashboard(){
@@ -60,34 +137,39 @@ async function updateDashboard(){
                 return;}
             throw new Error("Failed to fetch");}
         const data = await response.json();
-
-        // updated selected buttons 
-        if (data.status == "update") {
-            document.querySelectorAll('button[name="light"]').forEach(button => {
-                button.disabled = true;});
-        } else {
-            document.querySelectorAll('button[name="light"]').forEach(button => {
-                button.disabled = false;
-        });}
-
-        // update status text
-        const status_text = {"online": ["Online", "#34a834"],
-                             "offline": ["Offline", "#b72525"],
-                             "update": ["Updating", "#8344b3"]}
-        document.getElementById("statusText").innerText = status_text[data.status][0];
-        document.getElementById("statusText").style.color = status_text[data.status][1];
-        document.getElementById("port").innerText = data.port;
+        showStatus(data);
 
     } catch (err) {
         console.error("Error loading arduino data:", err);}
     await loadChart();
 }
 
+function showStatus(data){
+
+    // updated selected buttons 
+    if (data.status == "update") {
+        document.querySelectorAll('button[name="light"]').forEach(button => {
+            button.disabled = true;});
+    } else {
+        document.querySelectorAll('button[name="light"]').forEach(button => {
+            button.disabled = false;
+    });}
+
+    // update status text
+    const status_text = {"online": ["Online", "#34a834"],
+                         "offline": ["Offline", "#b72525"],
+                         "update": ["Updating", "#8344b3"]}
+    document.getElementById("statusText").innerText = status_text[data.status][0];
+    document.getElementById("statusText").style.color = status_text[data.status][1];
+    if (data.port !== undefined){
+        document.getElementById("port").innerText = data.port;}
+}
+
 async function loadChart() {
     try {
 
         // fetch temperature data
-        const response = await fetch('/api/temperature', {
+        const response = await fetch(`/api/temperature?range=${chartRange}`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
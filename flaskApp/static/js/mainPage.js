@@ -23,28 +23,25 @@ async function loadFish() {
         console.log(data);
 
         const fishBox = document.getElementById('fish_box');
-        const imageLoadPromises = [];
         fishBox.innerHTML = ''; 
         data.fish.forEach(fish => {
-
-            const img = document.createElement('img');
+            const img = data.atlas && data.atlas.fish[fish.name] ?
+                atlasTile(data.atlas, fish) : fishImg(fish);
             img.id = fish.name + "_fishImg";
-            img.src = `/fish/${fish.name}.png`;
-            img.alt = fish.name;
             img.classList.add('small_fish');
             img.style.cursor = 'pointer';
             img.addEventListener('click', () => set_main_fish(fish, img));
-
-            const p = new Promise(resolve => {
-                img.onload = resolve;
-                img.onerror = resolve;
-            });
-            imageLoadPromises.push(p);
             fishBox.appendChild(img);
         });
 
-        await Promise.all(imageLoadPromises);
+        // only the featured fish has to be ready before the page shows
+        const mainImg = document.getElementById('fotw_img');
+        const mainLoaded = new Promise(resolve => {
+            mainImg.onload = resolve;
+            mainImg.onerror = resolve;
+        });
         set_main_fish(data.fish[0], document.getElementById(data.fish[0].name + "_fishImg"))
+        await mainLoaded;
 
     } catch (error) {
         console.error('Error loading fish:', error);
@@ -53,12 +50,42 @@ async function loadFish() {
     }
 }
 
+// the server picks the format, the browser picks the size
+function fishImg(fish) {
+    const img = document.createElement('img');
+    img.src = fishUrl(fish, 250);
+    img.srcset = [125, 250, 500].map(w => `${fishUrl(fish, w)} ${w}w`).join(', ');
+    img.sizes = '(width > 1600px) 20vw, 250px';
+    img.decoding = 'async';
+    img.alt = fish.name;
+    return img;
+}
+
+// one cell of the shared sprite sheet, positioned in percent so it scales with the tile
+function atlasTile(atlas, fish) {
+    const [col, row] = atlas.fish[fish.name];
+    const tile = document.createElement('div');
+    tile.setAttribute('role', 'img');
+    tile.setAttribute('aria-label', fish.name);
+    const sheets = Object.entries(atlas.urls).map(([scale, url]) => `url('${url}') ${scale}x`);
+    tile.style.backgroundImage = `url('${atlas.urls['1']}')`;
+    tile.style.backgroundImage = `image-set(${sheets.join(', ')})`;
+    tile.style.backgroundSize = `${atlas.cols * 100}% ${atlas.rows * 100}%`;
+    tile.style.backgroundPosition = `${atlas.cols > 1 ? col * 100 / (atlas.cols - 1) : 0}% ` +
+        `${atlas.rows > 1 ? row * 100 / (atlas.rows - 1) : 0}%`;
+    return tile;
+}
+
+function fishUrl(fish, width) {
+    return `/fish/${encodeURIComponent(fish.name)}.png?w=${width}`;
+}
+
 function set_main_fish(fish, img) {
     if (selectedFishImg) selectedFishImg.classList.remove('selected');
     img.classList.add('selected');
     selectedFishImg = img;
 
-    document.getElementById('fotw_img').src = `/fish/${fish.name}.png`;
+    document.getElementById('fotw_img').src = fishUrl(fish, 500);
     document.getElementById('fotw_name').innerText = fish.name;
     document.getElementById('fotw_link').href = fish.wiki_url;
     document.getElementById('fotw_link').innerText = fish.wiki_url;
@@ -75,13 +102,14 @@ function set_main_fish(fish, img) {
     });
 
     const now = new Date();
+    const fotwDiv = document.getElementById('fotw_div');
     const diffDays = (now - d) / (1000 * 60 * 60 * 24);
     if (diffDays >= 0 && diffDays <= 7){
         document.getElementById('fotw_title').innerText = "This week's fish:";
-        document.getElementById('fotw_div').style.backgroundImage = "url('static/css/img/fish_bg.png')";
+        fotwDiv.style.backgroundImage = `url('${fotwDiv.dataset.currentBg}')`;
     } else {
         document.getElementById('fotw_title').innerText = `Week: ${date_text}:`;
-        document.getElementById('fotw_div').style.backgroundImage = "url('static/css/img/blue_bg.png')";
+        fotwDiv.style.backgroundImage = `url('${fotwDiv.dataset.pastBg}')`;
     }
 }
 
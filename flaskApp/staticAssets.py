@@ -0,0 +1,62 @@
+from flask import request, send_file, url_for, abort
+from werkzeug.security import safe_join
+import mimetypes
+import threading
+import json
+import os
+
+class StaticAssets:
+    """Serves the hashed, precompressed copies written by buildAssets.py.
+
+    Templates ask asset_url() for a file and get its hashed /assets/ path,
+    or the plain static URL when no build has been run. A hashed file never
+    changes, so it is sent with immutable caching, picking the brotli or
+    gzip copy the client accepts.
+    """
+
+    CACHE_CONTROL = 'public, max-age=31536000, immutable'
+    ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+    def __init__(self, dist_dir):
+        self.dist_dir = dist_dir
+        self.lock = threading.Lock()
+        self.manifest = None
+        self.hashed = set()
+
+    def load(self):
+        with self.lock:
+            if self.manifest is None:
+                try:
+                    with open(os.path.join(self.dist_dir, "manifest.json")) as f:
+                        self.manifest = json.load(f)
+                except (OSError, ValueError) as e:
+                    print(f"no static asset build, serving plain static files: {e}")
+                    self.manifest = {}
+                self.hashed = set(self.manifest.values())
+        return self.manifest
+
+    # url for a file under static/, hashed when it was built
+    def url(self, filename):
+        hashed = self.load().get(filename)
+        if hashed:
+            return url_for('serve_asset', filename=hashed)
+        return url_for('static', filename=filename)
+
+    def send(self, filename):
+        self.load()
+        if filename not in self.hashed:
+            abort(404)
+        path = safe_join(self.dist_dir, filename)
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        encoding = None
+        for name, suffix in self.ENCODINGS:
+            if name in request.accept_encodings and os.path.isfile(path + suffix):
+                encoding = name
+                path += suffix
+                break
+        response = send_file(path, mimetype=mimetype, conditional=False, etag=False)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Cache-Control'] = self.CACHE_CONTROL
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
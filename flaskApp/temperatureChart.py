@@ -0,0 +1,71 @@
+from model import CurrentTemperature, RetentionPolicy, temperature_added
+import threading
+import json
+import pytz
+
+class TemperatureChart:
+    """Pre-encoded /api/temperature bodies, one per chart window.
+
+    The chart rows are rebuilt only when a new hourly or daily row lands, and
+    the current reading is spliced in when a minute reading is committed, so a
+    request is a dict lookup that returns ready bytes.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.lock = threading.Lock()
+        self.charts = {}
+        self.ct = b"null"
+        self.payloads = {}
+        temperature_added.connect(self.on_temperature, weak=False)
+
+    def on_temperature(self, sender, temp, hourly):
+        try:
+            with self.app.app_context():
+                self.rebuild(charts=hourly or not self.charts)
+        except Exception as e:
+            print(f"failed to rebuild temperature chart: {e}")
+
+    # google charts rows for one window, temps in °F
+    def encode_chart(self, window):
+        label_format = RetentionPolicy.windows[window][2]
+        db_data = RetentionPolicy.get_window(window)
+        if not db_data:
+            return b"null"
+        est = pytz.timezone('America/New_York')
+        chart_data = {
+            'cols': [
+                {'label': 'Time', 'type': 'string'},
+                {'label': 'Temperature (°F)', 'type': 'number'}],
+            'rows': [
+                {'c': [{'v': t.timestamp.replace(tzinfo=pytz.utc).astimezone(est).strftime(label_format)},
+                       {'v': float(int((((t.avg_temp*(9/5))+32))*10))/10}]} for t in db_data]}
+        return json.dumps(chart_data).encode()
+
+    # needs an app context, charts=False only refreshes the current reading
+    def rebuild(self, charts=True):
+        if charts:
+            new_charts = {window: self.encode_chart(window) for window in RetentionPolicy.windows}
+        ct_val = CurrentTemperature.get_current()
+        ct = json.dumps(round((ct_val.current_temp * (9/5) + 32), 1)).encode() if ct_val else b"null"
+        with self.lock:
+            if charts:
+                self.charts = new_charts
+            self.ct = ct
+            self.payloads = {
+                window: b'{"chartData": ' + chart + b', "ct": ' + self.ct + b', "range": "' + window.encode() + b'"}'
+                for window, chart in self.charts.items()}
+
+    # ready-to-send body for a window, None for an unknown window
+    def get(self, window):
+        if window not in RetentionPolicy.windows:
+            return None
+        payload = self.payloads.get(window)
+        if payload is None:
+            with self.lock:
+                payload = self.payloads.get(window)
+            if payload is None:
+                with self.app.app_context():
+                    self.rebuild()
+                payload = self.payloads.get(window)
+        return payload
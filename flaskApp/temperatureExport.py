@@ -0,0 +1,89 @@
+from model import CurrentTemperature, TemperatureData, TemperatureDaily
+from sqlalchemy import select
+from datetime import datetime, timezone, date
+import json
+import csv
+import io
+
+# tier -> (ordering column, exported columns)
+TIERS = {
+    "raw": (CurrentTemperature.timestamp, [CurrentTemperature.timestamp, CurrentTemperature.current_temp]),
+    "hourly": (TemperatureData.timestamp, [
+        TemperatureData.timestamp, TemperatureData.avg_temp, TemperatureData.min_temp,
+        TemperatureData.max_temp, TemperatureData.stddev_temp, TemperatureData.sample_count]),
+    "daily": (TemperatureDaily.day, [
+        TemperatureDaily.day, TemperatureDaily.avg_temp, TemperatureDaily.min_temp,
+        TemperatureDaily.max_temp, TemperatureDaily.sample_count])}
+
+FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+# ISO 8601 in, naive UTC out like the stored timestamps, None when missing
+def parse_time(value):
+    if not value:
+        return None
+    when = datetime.fromisoformat(value[:-1] + "+00:00" if value.endswith("Z") else value)
+    if when.tzinfo:
+        when = when.astimezone(timezone.utc).replace(tzinfo=None)
+    return when
+
+def encode_value(value):
+    return value.isoformat() if isinstance(value, (datetime, date)) else value
+
+class TemperatureExport:
+    """Streams one temperature tier over a time range as CSV or NDJSON.
+
+    Rows are read as plain tuples through a server-side cursor, a batch at a
+    time, and each batch is encoded into one chunk of the response, so an
+    export of any length holds a single batch in memory and the header goes
+    out before the query runs.
+    """
+
+    def __init__(self, engine, tier, fmt, start=None, end=None, batch_size=2000):
+        if tier not in TIERS:
+            raise ValueError(f"unknown tier {tier}, expected one of {', '.join(TIERS)}")
+        if fmt not in FORMATS:
+            raise ValueError(f"unknown format {fmt}, expected one of {', '.join(FORMATS)}")
+        if start and end and start >= end:
+            raise ValueError("start must be before end")
+        self.engine = engine
+        self.tier = tier
+        self.fmt = fmt
+        self.start = start
+        self.end = end
+        self.batch_size = batch_size
+        self.order_by, self.columns = TIERS[tier]
+        self.names = [column.key for column in self.columns]
+
+    @property
+    def mimetype(self):
+        return FORMATS[self.fmt]
+
+    @property
+    def filename(self):
+        span = "-".join(when.strftime("%Y%m%dT%H%M") for when in (self.start, self.end) if when)
+        return f"temperature-{self.tier}{'-' + span if span else ''}.{self.fmt}"
+
+    def query(self):
+        stmt = select(*self.columns)
+        bound = (lambda when: when.date()) if self.tier == "daily" else (lambda when: when)
+        if self.start:
+            stmt = stmt.where(self.order_by >= bound(self.start))
+        if self.end:
+            stmt = stmt.where(self.order_by < bound(self.end))
+        return stmt.order_by(self.order_by)
+
+    def encode(self, rows):
+        if self.fmt == "ndjson":
+            return "".join(json.dumps(dict(zip(self.names, map(encode_value, row)))) + "\n" for row in rows).encode()
+        out = io.StringIO()
+        csv.writer(out).writerows([encode_value(value) for value in row] for row in rows)
+        return out.getvalue().encode()
+
+    # header first, then one chunk per batch off the cursor
+    def stream(self):
+        if self.fmt == "csv":
+            yield (",".join(self.names) + "\r\n").encode()
+        with self.engine.connect() as conn:
+            result = conn.execution_options(yield_per=self.batch_size).execute(self.query())
+            for rows in result.partitions():
+                yield self.encode(rows)
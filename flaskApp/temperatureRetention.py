@@ -0,0 +1,41 @@
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.cron import CronTrigger
+from model import TemperatureDaily, RetentionPolicy, temperature_added
+import threading
+import pytz
+
+class TemperatureRetention(threading.Thread):
+
+    def __init__(self, app):
+        super(TemperatureRetention, self).__init__()
+        self.app = app
+        self.daemon = True
+
+    # roll finished days into the daily tier, then drop expired rows
+    def maintain(self):
+        try:
+            with self.app.app_context():
+                added = TemperatureDaily.rollup()
+                deleted = RetentionPolicy.prune()
+                if added:
+                    temperature_added.send(self, temp=None, hourly=True)
+            print(f"temperature retention: {added} daily rollups, pruned {deleted}")
+        except Exception as e:
+            print(f"temperature retention failed: {e}")
+
+    # run the upkeep once at startup and then hourly, off the ingest path
+    def run(self):
+        self.maintain()
+        scheduler = BackgroundScheduler(timezone=pytz.utc)
+        scheduler.add_job(
+            func=self.maintain,
+            trigger=CronTrigger(minute=5, timezone=pytz.utc),
+            id='temperature_retention',
+            name='Roll up and prune temperature tiers',
+            replace_existing=True)
+        scheduler.start()
+        try:
+            while True:
+                threading.Event().wait(1)
+        except (KeyboardInterrupt, SystemExit):
+            scheduler.shutdown()
@@ -0,0 +1,5 @@
+import sys
+import os
+
+# the app's modules import each other by bare name, like under gunicorn
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
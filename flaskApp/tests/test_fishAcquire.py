@@ -0,0 +1,62 @@
+import socket
+import os
+
+import pytest
+
+from fishAcquire import FishAcquirer, StandInWiki, image_link
+
+@pytest.fixture
+def wiki():
+    wiki = StandInWiki(latency=0.02, missing_rate=0.2, fail_first=1, image_bytes=1000, seed=0)
+    wiki.start()
+    yield wiki
+    wiki.stop()
+
+# a local port with nothing listening, every request is refused
+def closed_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def make_acquirer(tmp_path, workers=4):
+    return FishAcquirer(str(tmp_path / "raw"), str(tmp_path / "checkpoint.json"), workers=workers, rate=1000,
+                        retry_delay=0.01)
+
+def test_image_link_skips_png_and_takes_the_original():
+    html = ('<a class="mw-file-description"><img src="//upload.example.org/x/Logo.svg.png"></a>'
+            '<a class="mw-file-description"><img src="//upload.example.org/wiki/thumb/a/ab/Cod.jpg/250px-Cod.jpg"></a>')
+    assert image_link(html, "https://en.example.org/wiki/Cod") == "https://upload.example.org/wiki/a/ab/Cod.jpg"
+    assert image_link("<p>no photo</p>", "https://en.example.org/wiki/Cod") is None
+
+def test_acquire_counts_retries_and_concurrency(tmp_path, wiki):
+    names = [f"Fish {i}" for i in range(40)]
+    fish = [(name, wiki.page_url(name)) for name in names]
+    fish.append(("No page", f"http://127.0.0.1:{wiki.port}/nowhere/No_page"))
+    fish.append(("Unreachable", f"http://127.0.0.1:{closed_port()}/wiki/Unreachable"))
+    with_photo = sum(wiki.has_photo(name.replace(" ", "_")) for name in names)
+    assert 0 < with_photo < len(names)
+
+    counts = make_acquirer(tmp_path).run(fish)
+
+    assert counts["done"] == with_photo
+    assert counts["missing"] == len(names) - with_photo + 1
+    assert counts["failed"] == 1
+    assert sorted(os.listdir(tmp_path / "raw")) == sorted(
+        f"{name}.jpg" for name in names if wiki.has_photo(name.replace(" ", "_")))
+
+    # every path answered 503 once and was retried
+    assert wiki.stats["errors"] == len(wiki.seen)
+    assert all(count == 2 for path, count in wiki.seen.items() if not path.startswith("/nowhere/"))
+    assert 1 < wiki.stats["peak_in_flight"] <= 4
+
+def test_rerun_skips_what_the_checkpoint_settled(tmp_path, wiki):
+    fish = [(f"Fish {i}", wiki.page_url(f"Fish {i}")) for i in range(20)]
+    fish.append(("Unreachable", f"http://127.0.0.1:{closed_port()}/wiki/Unreachable"))
+    first = make_acquirer(tmp_path).run(fish)
+    requests_before = wiki.stats["requests"]
+
+    again = make_acquirer(tmp_path).run(fish)
+
+    assert again["skipped"] == first["done"] + first["missing"]
+    assert again["failed"] == 1 and again["done"] == 0
+    assert wiki.stats["requests"] == requests_before
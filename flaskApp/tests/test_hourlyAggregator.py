@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+import statistics
+
+import pytest
+
+from hourlyAggregator import HourlyAggregator
+
+HOUR = datetime(2026, 3, 1, 14)
+
+def test_rollup_of_a_restarted_hour(tmp_path):
+    path = str(tmp_path / "hourly.json")
+    rollups = []
+    values = [20.0, 21.5, 19.0, 22.25, 20.5]
+    aggregator = HourlyAggregator(path, rollups.append)
+    for i, value in enumerate(values[:2]):
+        aggregator.add(value, HOUR + timedelta(minutes=i))
+
+    # a restart mid-hour carries on from the saved state
+    aggregator = HourlyAggregator(path, rollups.append)
+    for i, value in enumerate(values[2:]):
+        aggregator.add(value, HOUR + timedelta(minutes=10 + i))
+    aggregator.tick(HOUR + timedelta(minutes=59))
+    assert rollups == []
+
+    aggregator.tick(HOUR + timedelta(hours=1))
+    assert rollups == [{
+        "timestamp": (HOUR + timedelta(minutes=30)).isoformat(),
+        "avg": round(statistics.mean(values), 1),
+        "min": 19.0,
+        "max": 22.25,
+        "stddev": round(statistics.pstdev(values), 3),
+        "count": 5}]
+
+    # each hour is closed once, empty hours not at all
+    aggregator.tick(HOUR + timedelta(hours=3))
+    assert len(rollups) == 1
+
+def test_failed_rollup_keeps_the_hour(tmp_path):
+    path = str(tmp_path / "hourly.json")
+
+    def crash(rollup):
+        raise OSError("spool unavailable")
+
+    aggregator = HourlyAggregator(path, crash)
+    aggregator.add(20.0, HOUR)
+    with pytest.raises(OSError):
+        aggregator.tick(HOUR + timedelta(hours=1))
+
+    # after the crash the hour is still on disk and is rolled up on the next start
+    rollups = []
+    HourlyAggregator(path, rollups.append).tick(HOUR + timedelta(hours=1))
+    assert [rollup["count"] for rollup in rollups] == [1]
@@ -0,0 +1,50 @@
+import json
+import os
+
+from metrics import Registry, Counter, Histogram, Gauge
+
+def make_registry():
+    registry = Registry()
+    requests = registry.add(Counter("t_requests_total", "requests", ("route",)))
+    latency = registry.add(Histogram("t_seconds", "latency", buckets=(0.1, 1)))
+    registry.add(Gauge("t_entries", "entries", lambda: 3))
+    return registry, requests, latency
+
+def write_snapshot(directory, name, pid, registry):
+    with open(os.path.join(directory, name), "w") as f:
+        json.dump({"pid": pid, "metrics": {m.name: m.snapshot() for m in registry.metrics}}, f)
+
+def test_shared_registry_sums_every_process(tmp_path):
+    registry, requests, latency = make_registry()
+    registry.directory = str(tmp_path)
+    registry.snapshot_path = str(tmp_path / "self.json")
+    requests.inc("/a")
+    latency.observe(0.05)
+
+    # another live worker, and one that has exited
+    other, other_requests, other_latency = make_registry()
+    other_requests.inc("/a", amount=2)
+    other_requests.inc("/b")
+    other_latency.observe(0.5)
+    write_snapshot(tmp_path, "other.json", os.getppid(), other)
+    gone, gone_requests, _ = make_registry()
+    gone_requests.inc("/a", amount=10)
+    write_snapshot(tmp_path, "gone.json", 2 ** 22 + 1, gone)
+
+    lines = registry.render().splitlines()
+    assert 't_requests_total{route="/a"} 13' in lines
+    assert 't_requests_total{route="/b"} 1' in lines
+    assert 't_seconds_bucket{le="0.1"} 1' in lines
+    assert 't_seconds_bucket{le="1"} 2' in lines
+    assert 't_seconds_count 2' in lines
+
+    # gauges stay per process, and only for processes still running
+    gauges = sorted(line for line in lines if line.startswith("t_entries{"))
+    assert gauges == sorted([f't_entries{{pid="{os.getpid()}"}} 3', f't_entries{{pid="{os.getppid()}"}} 3'])
+
+def test_unshared_registry_reports_this_process():
+    registry, requests, _ = make_registry()
+    requests.inc("/a")
+    lines = registry.render().splitlines()
+    assert 't_requests_total{route="/a"} 1' in lines
+    assert "t_entries 3" in lines
@@ -0,0 +1,75 @@
+import pytest
+
+import serialProtocol as protocol
+
+def test_colors_round_trip():
+    zones = [(255, 0, 0), (0, 128, 255), (1, 2, 3)]
+    frames = protocol.FrameDecoder().feed(protocol.encode_colors(7, zones))
+    assert [(f.type, f.seq) for f in frames] == [(protocol.COLORS, 7)]
+    assert protocol.decode_colors(frames[0].payload) == list(enumerate(zones))
+
+def test_ack_and_temp_round_trip():
+    data = protocol.encode_ack(3, 258, protocol.ACK_BAD_PAYLOAD) + protocol.encode_temp(4, 21.5)
+    ack, temp = protocol.FrameDecoder().feed(data)
+    assert (ack.type, ack.seq) == (protocol.ACK, 3)
+    assert protocol.decode_ack(ack.payload) == (2, protocol.ACK_BAD_PAYLOAD)
+    assert (temp.type, temp.seq) == (protocol.TEMP, 4)
+    assert protocol.decode_temp(temp.payload) == 21.5
+
+def test_seq_wraps_to_a_byte():
+    frame, = protocol.FrameDecoder().feed(protocol.encode(protocol.HELLO, 256 + 9))
+    assert frame.seq == 9 and frame.payload == b""
+
+def test_frames_split_across_reads():
+    data = protocol.encode_temp(1, 20.0) + protocol.encode_colors(2, [(9, 9, 9)])
+    decoder = protocol.FrameDecoder()
+    frames = []
+    for i in range(len(data)):
+        frames += decoder.feed(data[i:i + 1])
+    assert [f.seq for f in frames] == [1, 2]
+    assert decoder.dropped == 0
+
+def test_resync_after_garbage():
+    # noise, including a stray magic byte and a whole fake magic, before and between frames
+    noise = b"\x00\xffhello\xa5\xa5\x5a\x01"
+    data = noise + protocol.encode_temp(1, 19.0) + b"\xa5" + protocol.encode_temp(2, 19.5)
+    decoder = protocol.FrameDecoder()
+    frames = decoder.feed(data)
+    assert [protocol.decode_temp(f.payload) for f in frames] == [19.0, 19.5]
+    assert decoder.frames == 2
+    assert decoder.dropped >= len(noise)
+
+def test_bad_crc_is_dropped_and_the_next_frame_kept():
+    bad = bytearray(protocol.encode_temp(1, 30.0))
+    bad[-1] ^= 0xFF
+    decoder = protocol.FrameDecoder()
+    frames = decoder.feed(bytes(bad) + protocol.encode_temp(2, 31.0))
+    assert [(f.seq, protocol.decode_temp(f.payload)) for f in frames] == [(2, 31.0)]
+    assert decoder.dropped > 0
+
+def test_corrupt_payload_fails_the_crc():
+    frame = bytearray(protocol.encode_colors(5, [(10, 20, 30)]))
+    frame[7] ^= 0x01
+    assert protocol.FrameDecoder().feed(bytes(frame)) == []
+
+def test_oversized_length_is_skipped():
+    header = protocol.MAGIC + protocol.HEADER.pack(protocol.LOG, 1, protocol.MAX_PAYLOAD + 1)
+    frames = protocol.FrameDecoder().feed(header + protocol.encode_temp(2, 18.0))
+    assert [f.seq for f in frames] == [2]
+
+def test_partial_frame_waits_for_the_rest():
+    data = protocol.encode_temp(1, 22.0)
+    decoder = protocol.FrameDecoder()
+    assert decoder.feed(data[:-1]) == []
+    assert [f.seq for f in decoder.feed(data[-1:])] == [1]
+
+def test_payload_over_the_limit_is_refused():
+    with pytest.raises(ValueError):
+        protocol.encode(protocol.LOG, 1, b"x" * (protocol.MAX_PAYLOAD + 1))
+
+def test_colors_numbered_from_first():
+    zones = [(i, i, i) for i in range(protocol.MAX_ZONES)]
+    frame, = protocol.FrameDecoder().feed(protocol.encode_colors(1, zones, first=protocol.MAX_ZONES))
+    assert protocol.decode_colors(frame.payload)[0] == (protocol.MAX_ZONES, (0, 0, 0))
+    with pytest.raises(ValueError):
+        protocol.encode_colors(2, zones + [(0, 0, 0)])
@@ -0,0 +1,170 @@
+import serialProtocol as protocol
+import threading
+import argparse
+import random
+import select
+import math
+import time
+import tty
+import pty
+import os
+
+class VirtualArduino(threading.Thread):
+    """Pty-backed stand-in for the board running arduino/sketch_jul3a.ino.
+
+    It speaks the framed protocol: HELLO after each (re)plug, an ACK for every
+    COLORS frame once applied, and a TEMP frame every minute of device time.
+    The device clock runs `speed` times faster than real time, and bytes are
+    held back for as long as they would take on the wire at `baud`. The
+    port is reached through a fixed symlink, so unplug() and a later replug
+    look to the host like the same board disappearing and coming back.
+    Noise can be injected between frames with garbage_rate.
+    """
+
+    TEMP_INTERVAL = 60
+
+    def __init__(self, link_path="/tmp/virtual-arduino", speed=1.0, baud=9600,
+                 boot_delay=2.0, garbage_rate=0.0, seed=None):
+        super(VirtualArduino, self).__init__()
+        self.daemon = True
+        self.link_path = link_path
+        self.speed = speed
+        self.baud = baud
+        self.boot_delay = boot_delay
+        self.garbage_rate = garbage_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.master = None
+        self.slave = None
+        self.plugged = threading.Event()
+        self.stopped = threading.Event()
+        self.decoder = protocol.FrameDecoder()
+        self.seq = 0
+        self.zones = {}
+        self.on_colors = None
+        self.stats = {"temps": 0, "colors": 0, "acks": 0, "garbage_bytes": 0, "disconnects": 0}
+        self.plug()
+
+    @property
+    def path(self):
+        return self.link_path
+
+    def device_time(self):
+        return time.monotonic() * self.speed
+
+    # a new pty behind the same symlink, like the board enumerating again
+    def plug(self):
+        master, slave = pty.openpty()
+        tty.setraw(slave)
+        tmp_link = f"{self.link_path}.{os.getpid()}.tmp"
+        if os.path.lexists(tmp_link):
+            os.remove(tmp_link)
+        os.symlink(os.ttyname(slave), tmp_link)
+        os.replace(tmp_link, self.link_path)
+        with self.lock:
+            self.master, self.slave = master, slave
+            self.decoder.reset()
+            self.booted_at = time.monotonic() + self.boot_delay / self.speed
+            self.hello_sent = False
+        self.plugged.set()
+
+    # close the pty so the host's next read fails, then replug after downtime
+    def unplug(self, downtime=0.5):
+        with self.lock:
+            master, slave = self.master, self.slave
+            self.master = self.slave = None
+            self.plugged.clear()
+            self.stats["disconnects"] += 1
+        for fd in (master, slave):
+            if fd is not None:
+                os.close(fd)
+        if os.path.lexists(self.link_path):
+            os.remove(self.link_path)
+        if downtime is not None:
+            threading.Timer(downtime, self.plug).start()
+
+    def stop(self):
+        self.stopped.set()
+        self.unplug(downtime=None)
+
+    def send(self, frame):
+        if self.garbage_rate and self.rng.random() < self.garbage_rate:
+            junk = bytes(self.rng.randrange(256) for _ in range(self.rng.randint(1, 12)))
+            self.stats["garbage_bytes"] += len(junk)
+            frame = junk + frame
+        time.sleep(len(frame) * 10 / self.baud)
+        with self.lock:
+            if self.master is None:
+                return
+            try:
+                os.write(self.master, frame)
+            except OSError:
+                return
+        self.seq = (self.seq + 1) & 0xFF
+
+    # reading in C, a slow daily swing plus sensor noise
+    def read_sensor(self):
+        hours = self.device_time() / 3600
+        return 21.5 + 3 * math.sin(hours / 24 * 2 * math.pi) + self.rng.gauss(0, 0.1)
+
+    def handle(self, frame):
+        if frame.type != protocol.COLORS:
+            return
+        status = protocol.ACK_OK
+        try:
+            for zone, rgb in protocol.decode_colors(frame.payload):
+                self.zones[zone] = rgb
+        except Exception:
+            status = protocol.ACK_BAD_PAYLOAD
+        self.stats["colors"] += 1
+        time.sleep((len(frame.payload) + 7) * 10 / self.baud)
+        self.send(protocol.encode_ack(self.seq, frame.seq, status))
+        self.stats["acks"] += 1
+        if self.on_colors:
+            self.on_colors(frame.seq, dict(self.zones))
+
+    def run(self):
+        next_temp = self.device_time() + self.TEMP_INTERVAL
+        while not self.stopped.is_set():
+            if not self.plugged.wait(0.1):
+                continue
+            with self.lock:
+                master = self.master
+            if master is None:
+                continue
+            if not self.hello_sent and time.monotonic() >= self.booted_at:
+                self.hello_sent = True
+                self.send(protocol.encode(protocol.HELLO, self.seq))
+            timeout = max(0, (next_temp - self.device_time()) / self.speed)
+            try:
+                ready, _, _ = select.select([master], [], [], min(timeout, 0.05))
+                data = os.read(master, 1024) if ready else b""
+            except (OSError, ValueError):
+                continue
+            for frame in self.decoder.feed(data):
+                self.handle(frame)
+            if self.device_time() >= next_temp:
+                next_temp += self.TEMP_INTERVAL
+                self.send(protocol.encode_temp(self.seq, self.read_sensor()))
+                self.stats["temps"] += 1
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulated arduino on a pty, point the arduino port at --link")
+    parser.add_argument("--link", default="/tmp/virtual-arduino")
+    parser.add_argument("--speed", type=float, default=1.0, help="device clock multiplier")
+    parser.add_argument("--baud", type=int, default=9600)
+    parser.add_argument("--garbage-rate", type=float, default=0.0, help="chance of noise before each frame")
+    parser.add_argument("--unplug-every", type=float, default=0, help="seconds between simulated disconnects")
+    args = parser.parse_args()
+    device = VirtualArduino(args.link, args.speed, args.baud, garbage_rate=args.garbage_rate)
+    device.on_colors = lambda seq, zones: print(f"colors {seq}: {zones}")
+    device.start()
+    print(f"virtual arduino on {device.path}")
+    try:
+        while True:
+            time.sleep(args.unplug_every if args.unplug_every else 3600)
+            if args.unplug_every:
+                print("unplugging")
+                device.unplug()
+    except KeyboardInterrupt:
+        device.stop()
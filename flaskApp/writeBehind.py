@@ -0,0 +1,150 @@
+from model import db, Arduino, CurrentTemperature, TemperatureData, temperature_added, notify
+from datetime import datetime
+import metrics
+import threading
+import time
+import json
+import os
+
+class WriteBehind(threading.Thread):
+    """Buffers sensor readings and state changes, flushing them in one transaction.
+
+    Every record is appended to a local spool file before it is queued, and the
+    spool is only cleared once the records are committed. A spool left over from
+    a crash or a database outage is replayed on the next start.
+    """
+
+    def __init__(self, app, spool_path=None, flush_interval=5, max_backoff=60):
+        super(WriteBehind, self).__init__()
+        self.app = app
+        self.daemon = True
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self.spool_path = spool_path if spool_path else os.getenv(
+            "SENSOR_SPOOL", os.path.join(app.root_path, "spool", "sensor.jsonl"))
+        os.makedirs(os.path.dirname(self.spool_path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.pending = self.replay()
+        self.spool = open(self.spool_path, "a")
+
+    # read records a previous run spooled but never committed
+    def replay(self):
+        records = []
+        if not os.path.isfile(self.spool_path):
+            return records
+        with open(self.spool_path) as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    print(f"skipping torn spool line: {line!r}")
+        if records:
+            print(f"replaying {len(records)} spooled records")
+        return records
+
+    # spool a record and queue it for the next flush
+    def put(self, kind, value, timestamp=None):
+        record = {"kind": kind, "value": value, "ts": (timestamp if timestamp else datetime.utcnow()).isoformat()}
+        with self.lock:
+            self.spool.write(json.dumps(record) + "\n")
+            self.spool.flush()
+            self.pending.append(record)
+
+    def put_temp(self, temp, timestamp=None):
+        self.put("temp", float(temp), timestamp)
+
+    # a rollup from the hourly aggregator, stamped with its own mid-hour time
+    def put_hourly(self, rollup):
+        stats = {k: v for k, v in rollup.items() if k != "timestamp"}
+        self.put("hourly", stats, datetime.fromisoformat(rollup["timestamp"]))
+
+    # state is cached right away so readers never wait on the flush
+    def put_state(self, device_id, state):
+        if state != Arduino.get_state(device_id):
+            Arduino.cache_state(device_id, state)
+            self.put("state", {"id": device_id, "state": state})
+
+    # failed connection attempts of a board and when it is tried next
+    def put_backoff(self, device_id, failures, retry_at):
+        self.put("backoff", {"id": device_id, "failures": failures,
+                             "retry_at": retry_at.isoformat() if retry_at else None})
+
+    # write everything queued so far in a single transaction
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                batch = self.pending
+                self.pending = []
+            if not batch:
+                return True
+            start = time.perf_counter()
+            with self.app.app_context():
+                try:
+                    states = {}
+                    backoffs = {}
+                    temp = None
+                    hourly = False
+                    for record in batch:
+                        timestamp = datetime.fromisoformat(record["ts"])
+                        if record["kind"] == "temp":
+                            CurrentTemperature.add_temp(record["value"], timestamp, commit=False)
+                            temp = record["value"]
+                        elif record["kind"] == "hourly":
+
+                            # an hour spooled again after a crash is only stored once
+                            if TemperatureData.has_hour(timestamp):
+                                continue
+                            stats = record["value"]
+                            if isinstance(stats, dict):
+                                TemperatureData.add_temp(stats["avg"], timestamp, commit=False,
+                                                         min_temp=stats["min"], max_temp=stats["max"],
+                                                         stddev_temp=stats["stddev"], sample_count=stats["count"])
+                            else:
+                                TemperatureData.add_temp(stats, timestamp, commit=False)
+                            hourly = True
+                        elif record["kind"] == "state" and isinstance(record["value"], dict):
+                            states[record["value"]["id"]] = record["value"]["state"]
+                        elif record["kind"] == "backoff":
+                            backoffs[record["value"]["id"]] = record["value"]
+
+                    # only the last of each board, skipping a state someone else has already replaced
+                    for device_id, state in states.items():
+                        if state == Arduino.get_state(device_id):
+                            Arduino.update_state(state, device_id, commit=False)
+                    for device_id, backoff in backoffs.items():
+                        retry_at = datetime.fromisoformat(backoff["retry_at"]) if backoff["retry_at"] else None
+                        Arduino.update_backoff(device_id, backoff["failures"], retry_at, commit=False)
+                    if temp is not None or hourly:
+                        notify("temperature", temp=temp, hourly=hourly)
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"write-behind flush failed, keeping {len(batch)} records: {e}")
+                    with self.lock:
+                        self.pending = batch + self.pending
+                    metrics.flush_latency.observe(time.perf_counter() - start, "failed")
+                    return False
+                metrics.flush_latency.observe(time.perf_counter() - start, "committed")
+                metrics.flush_records.inc(amount=len(batch))
+                if temp is not None or hourly:
+                    temperature_added.send(self, temp=temp, hourly=hourly)
+
+            # drop the committed records from the spool
+            with self.lock:
+                self.spool.seek(0)
+                self.spool.truncate()
+                for record in self.pending:
+                    self.spool.write(json.dumps(record) + "\n")
+                self.spool.flush()
+            return True
+
+    # flush on an interval, backing off while the database is unreachable
+    def run(self):
+        backoff = self.flush_interval
+        while True:
+            threading.Event().wait(backoff)
+            if self.flush():
+                backoff = self.flush_interval
+            else:
+                backoff = min(backoff * 2, self.max_backoff)
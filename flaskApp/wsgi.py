@@ -1,16 +1,26 @@
 import sys
 import signal
-from flask_server import app
+from flask_server import app, warmup, state_sync
 from fishOfTheWeek import FishOfTheWeek
-from arduinoInterface import ArduinoInterface
+from deviceManager import DeviceManager
+from temperatureRetention import TemperatureRetention
+
+# serial port and schedulers, run by exactly one process, none of it blocks startup
+def start_background():
+    data_b = DeviceManager(app)
+    fish_bowl = FishOfTheWeek(app)
+    temp_keeper = TemperatureRetention(app)
+    data_b.start()
+    fish_bowl.start()
+    temp_keeper.start()
 
 def signal_handler(sig, frame):
     sys.exit(0)
 
+# development server, single process
 if __name__ == "__main__":
     signal.signal(signal.SIGINT, signal_handler)
-    data_b = ArduinoInterface(app)
-    fish_bowl = FishOfTheWeek(app)
-    data_b.start()
-    fish_bowl.start()
-    app.run(host="0.0.0.0", port="5100", debug=False)
\ No newline at end of file
+    warmup.ensure_started()
+    state_sync.ensure_started()
+    start_background()
+    app.run(host="0.0.0.0", port="5100", debug=False)